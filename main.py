@@ -1,79 +1,1812 @@
+import time
+IMPORT_START = time.perf_counter()
 import pygame
 import random
 import os
-import cv2
-import time
+import io
 import sys
+import argparse
+import json
+import queue
+import threading
+import struct
+import hashlib
+import math
+import itertools
+import mmap
+import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from enum import IntEnum
+import numpy as np
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
 
-class Particle:
-    def __init__(self, x, y, color, lifetime=500):
-        self.x = x
-        self.y = y
-        self.radius = random.randint(4, 8)
-        self.color = color
+class KeyState(frozenset):
+    def __getitem__(self, key):
+        return key in self
+
+class ScriptedInput:
+    DIRECTIONS = (
+        (pygame.K_LEFT,), (pygame.K_RIGHT,), (pygame.K_UP,), (pygame.K_DOWN,),
+        (pygame.K_LEFT, pygame.K_UP), (pygame.K_LEFT, pygame.K_DOWN),
+        (pygame.K_RIGHT, pygame.K_UP), (pygame.K_RIGHT, pygame.K_DOWN),
+        (),
+    )
+
+    def __init__(self, seed=0, min_hold=10, max_hold=60):
+        self.rng = random.Random(seed)
+        self.min_hold = min_hold
+        self.max_hold = max_hold
+        self.keys = KeyState()
+        self.hold = 0
+
+    def next_keys(self):
+        if self.hold <= 0:
+            self.keys = KeyState(self.rng.choice(self.DIRECTIONS))
+            self.hold = self.rng.randint(self.min_hold, self.max_hold)
+        self.hold -= 1
+        return self.keys
+
+class InputLog:
+    MAGIC = b"CEIR"
+    VERSION = 3
+    LEVEL_DIGEST_SIZE = 16
+    HEADER = struct.Struct(f"<4sHq{LEVEL_DIGEST_SIZE}sH")
+    RECORD = struct.Struct("<BBHI")
+    MOUSE = struct.Struct("<BBHHH")
+    TICK = 0
+    RESET = 1
+    MOUSE_DOWN = 2
+    MOUSE_UP = 3
+    KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN)
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        magic, version, self.seed, self.level_digest, path_length = self.HEADER.unpack_from(self.data)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{path} is not a version {self.VERSION} input log")
+        self.records_start = self.HEADER.size + path_length
+        self.level_path = self.data[self.HEADER.size:self.records_start].decode()
+
+    def __iter__(self):
+        return self.RECORD.iter_unpack(memoryview(self.data)[self.records_start:])
+
+    def __len__(self):
+        return (len(self.data) - self.records_start) // self.RECORD.size
+
+    @classmethod
+    def key_mask(cls, keys):
+        mask = 0
+        for bit, key in enumerate(cls.KEYS):
+            if keys[key]:
+                mask |= 1 << bit
+        return mask
+
+    @classmethod
+    def key_states(cls):
+        return [KeyState(key for bit, key in enumerate(cls.KEYS) if mask >> bit & 1) for mask in range(1 << len(cls.KEYS))]
+
+    @staticmethod
+    def mouse_pos(value):
+        return (value & 0xFFFF, value >> 16)
+
+class InputRecorder:
+    def __init__(self, path, seed, level):
+        level_path = level.path.encode()
+        self.file = open(path, "wb")
+        self.file.write(InputLog.HEADER.pack(InputLog.MAGIC, InputLog.VERSION, seed, level.digest, len(level_path)))
+        self.file.write(level_path)
+        self.ticks = 0
+
+    def tick(self, keys, dt, now):
+        self.file.write(InputLog.RECORD.pack(InputLog.TICK, InputLog.key_mask(keys), min(round(dt), 0xFFFF), now))
+        self.ticks += 1
+
+    def reset(self, now):
+        self.file.write(InputLog.RECORD.pack(InputLog.RESET, 0, 0, now))
+
+    def mouse(self, down, button, pos):
+        kind = InputLog.MOUSE_DOWN if down else InputLog.MOUSE_UP
+        x, y = pos
+        self.file.write(InputLog.MOUSE.pack(kind, min(button, 0xFF), 0, int(x), int(y)))
+
+    def close(self):
+        self.file.close()
+
+class SessionLog:
+    MAGIC = b"CESL"
+    VERSION = 2
+    HEADER = struct.Struct("<4sH")
+    RECORD = struct.Struct("<dQIIIBIfff")
+    DTYPE = np.dtype([
+        ("time", "<f8"), ("seed", "<u8"), ("elapsed_ms", "<u4"), ("pickups", "<u4"), ("power_ups", "<u4"),
+        ("cleared", "u1"), ("frames", "<u4"), ("frame_p50", "<f4"), ("frame_p95", "<f4"), ("frame_max", "<f4"),
+    ])
+
+    @classmethod
+    def check_header(cls, data, path):
+        magic, version = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"{path} is not a version {cls.VERSION} session log")
+
+    @classmethod
+    def is_current(cls, path):
+        with open(path, "rb") as f:
+            data = f.read(cls.HEADER.size)
+        return len(data) == cls.HEADER.size and cls.HEADER.unpack(data) == (cls.MAGIC, cls.VERSION)
+
+    @classmethod
+    def record_count(cls, path):
+        return max(0, (os.path.getsize(path) - cls.HEADER.size) // cls.RECORD.size)
+
+class TelemetryWriter:
+    QUEUE_SIZE = 1024
+    SYNC_RECORDS = 64
+    SYNC_SECONDS = 2.0
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) and not SessionLog.is_current(path):
+            os.replace(path, path + ".old")
+        self.queue = queue.Queue(self.QUEUE_SIZE)
+        self.stats = {"submitted": 0, "dropped": 0, "invalid": 0, "written": 0, "syncs": 0, "write_ms": 0.0}
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def submit(self, record):
+        try:
+            packed = SessionLog.RECORD.pack(*record)
+        except (struct.error, TypeError):
+            self.stats["invalid"] += 1
+            return False
+        try:
+            self.queue.put_nowait(packed)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["submitted"] += 1
+        return True
+
+    def take_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.SYNC_SECONDS)]
+        except queue.Empty:
+            return [], False
+        while batch[-1] is not None:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch, False
+        batch.pop()
+        return batch, True
+
+    def run(self):
+        stats = self.stats
+        with open(self.path, "ab") as f:
+            if f.tell() == 0:
+                f.write(SessionLog.HEADER.pack(SessionLog.MAGIC, SessionLog.VERSION))
+            unsynced = 0
+            last_sync = time.monotonic()
+            closing = False
+            while not closing:
+                batch, closing = self.take_batch()
+                start = time.perf_counter()
+                if batch:
+                    f.write(b"".join(batch))
+                    stats["written"] += len(batch)
+                    unsynced += len(batch)
+                now = time.monotonic()
+                if unsynced and (closing or unsynced >= self.SYNC_RECORDS or now - last_sync >= self.SYNC_SECONDS):
+                    f.flush()
+                    os.fsync(f.fileno())
+                    stats["syncs"] += 1
+                    unsynced = 0
+                    last_sync = now
+                stats["write_ms"] += (time.perf_counter() - start) * 1000
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+class Leaderboard:
+    MAGIC = b"CESI"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHQI")
+    KEEP = 100
+    CHUNK_RECORDS = 1 << 20
+
+    def __init__(self, path, keep=KEEP):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.keep = keep
+        self.scanned = 0
+        self.best = np.zeros(0, SessionLog.DTYPE)
+        self.recent = np.zeros(0, SessionLog.DTYPE)
+        self.load_index()
+
+    def load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        data = read_file(self.index_path)
+        magic, version, scanned, count = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or version != self.VERSION:
+            return
+        self.scanned = scanned
+        self.best = np.frombuffer(data, SessionLog.DTYPE, count, self.HEADER.size).copy()
+
+    def save_index(self):
+        with open(self.index_path + ".tmp", "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.scanned, len(self.best)))
+            f.write(self.best.tobytes())
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def refresh(self):
+        if not os.path.exists(self.path):
+            return 0
+        count = SessionLog.record_count(self.path)
+        if count < self.scanned:
+            self.scanned = 0
+            self.best = self.best[:0]
+        if count == self.scanned:
+            return 0
+        added = count - self.scanned
+        with open(self.path, "rb") as f:
+            SessionLog.check_header(f.read(SessionLog.HEADER.size), self.path)
+            f.seek(SessionLog.HEADER.size + self.scanned * SessionLog.RECORD.size)
+            while self.scanned < count:
+                chunk = min(self.CHUNK_RECORDS, count - self.scanned)
+                records = np.frombuffer(f.read(chunk * SessionLog.RECORD.size), SessionLog.DTYPE)
+                self.best = self.merge(self.best, records)
+                self.scanned += chunk
+        self.save_index()
+        return added
+
+    def merge(self, best, records):
+        combined = np.concatenate((best, records[records["cleared"] == 1]))
+        if len(combined) > self.keep:
+            combined = combined[np.argpartition(combined["elapsed_ms"], self.keep - 1)[:self.keep]]
+        return combined[np.argsort(combined["elapsed_ms"], kind="stable")]
+
+    def offer(self, record):
+        self.recent = self.merge(self.recent, np.array([tuple(record)], SessionLog.DTYPE))
+
+    def top(self, n):
+        best = self.best
+        if len(self.recent):
+            best = np.concatenate((best, self.recent))
+            best = best[np.argsort(best["elapsed_ms"], kind="stable")]
+        return best[:n]
+
+class Kind(IntEnum):
+    PLAYER = 0
+    OBSTACLE = 1
+    TRASH1 = 2
+    TRASH2 = 3
+    TRASH3 = 4
+    TRASH4 = 5
+    SHAWARMA = 6
+    LEMON = 7
+
+class View:
+    def __init__(self, base_size, size=None):
+        self.base_width, self.base_height = base_size
+        self.resize(size or base_size)
+
+    def resize(self, size):
+        self.width, self.height = size
+        self.scale_x = self.width / self.base_width
+        self.scale_y = self.height / self.base_height
+
+    @property
+    def scale(self):
+        return (self.scale_x, self.scale_y)
+
+    def to_screen(self, pos):
+        return (int(pos[0] * self.scale_x), int(pos[1] * self.scale_y))
+
+    def to_screen_rect(self, rect):
+        return pygame.Rect(
+            int(rect.x * self.scale_x), int(rect.y * self.scale_y),
+            int(rect.width * self.scale_x), int(rect.height * self.scale_y)
+        )
+
+    def to_world(self, pos):
+        return (pos[0] / self.scale_x, pos[1] / self.scale_y)
+
+    def to_world_rect(self, rect):
+        left = int(rect.left / self.scale_x)
+        top = int(rect.top / self.scale_y)
+        right = math.ceil(rect.right / self.scale_x)
+        bottom = math.ceil(rect.bottom / self.scale_y)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+class Entity:
+    __slots__ = ("kind", "rect")
+
+    def __init__(self, kind, rect):
+        self.kind = kind
+        self.rect = rect
+
+class SpatialGrid:
+    def __init__(self, cell_size=200):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.items = {}
+        self.sequence = 0
+
+    @classmethod
+    def from_cells(cls, cell_size, items, cells):
+        grid = cls(cell_size)
+        item_cells = [[] for _ in items]
+        for cell, indices in cells:
+            bucket = grid.cells[cell] = {}
+            for index in indices:
+                item, rect = items[index]
+                bucket[id(item)] = rect
+                item_cells[index].append(cell)
+        for sequence, ((item, rect), keys) in enumerate(zip(items, item_cells), 1):
+            grid.items[id(item)] = (item, rect, keys, sequence)
+        grid.sequence = len(items)
+        return grid
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return (entry[0] for entry in list(self.items.values()))
+
+    def cell_keys(self, rect):
+        size = self.cell_size
+        x0 = rect.left // size
+        y0 = rect.top // size
+        x1 = (rect.right - 1) // size
+        y1 = (rect.bottom - 1) // size
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, item, rect):
+        key = id(item)
+        keys = self.cell_keys(rect)
+        self.sequence += 1
+        self.items[key] = (item, rect, keys, self.sequence)
+        for cell in keys:
+            self.cells.setdefault(cell, {})[key] = rect
+
+    def remove(self, item):
+        key = id(item)
+        _, _, keys, _ = self.items.pop(key)
+        for cell in keys:
+            bucket = self.cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, rect, ordered=False):
+        found = {}
+        for cell in self.cell_keys(rect):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(rect.collidedictall(bucket, True))
+        items = self.items
+        keys = sorted(found, key=lambda key: items[key][3]) if ordered else found
+        return [items[key][0] for key in keys]
+
+    def collides(self, rect):
+        for cell in self.cell_keys(rect):
+            bucket = self.cells.get(cell)
+            if bucket and rect.collidedict(bucket, True):
+                return True
+        return False
+
+class ParticlePool:
+    COLORKEY = (255, 0, 255)
+
+    def __init__(self, capacity=100000, lifetime=500, seed=None):
+        self.capacity = capacity
+        self.budget = capacity
         self.lifetime = lifetime
-        self.spawn_time = pygame.time.get_ticks()
-        self.vel_x = random.uniform(-2, 2)
-        self.vel_y = random.uniform(-2, 2)
+        self.count = 0
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.vx = np.zeros(capacity, np.float32)
+        self.vy = np.zeros(capacity, np.float32)
+        self.radius = np.zeros(capacity, np.float32)
+        self.spawn_time = np.zeros(capacity, np.int64)
+        self.color = np.zeros(capacity, np.uint8)
+        self.columns = (self.x, self.y, self.vx, self.vy, self.radius, self.spawn_time, self.color)
+        self.palette = []
+        self.palette_index = {}
+        self.sprites = {}
+        self.rng = np.random.default_rng(seed)
 
-    def update(self):
-        self.x += self.vel_x
-        self.y += self.vel_y
-        self.radius = max(0, self.radius - 0.2)
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def color_index(self, color):
+        index = self.palette_index.get(color)
+        if index is None:
+            index = len(self.palette)
+            self.palette.append(color)
+            self.palette_index[color] = index
+        return index
+
+    def spawn(self, x, y, color, now, count=15):
+        count = min(count, self.budget)
+        overflow = self.count + count - self.budget
+        if overflow > 0:
+            self.recycle(overflow)
+
+        s = slice(self.count, self.count + count)
+        self.x[s] = x
+        self.y[s] = y
+        self.vx[s] = self.rng.uniform(-2, 2, count)
+        self.vy[s] = self.rng.uniform(-2, 2, count)
+        self.radius[s] = self.rng.integers(4, 9, count)
+        self.spawn_time[s] = now
+        self.color[s] = self.color_index(color)
+        self.count += count
+
+    def recycle(self, n):
+        live = self.count
+        oldest = np.argpartition(self.spawn_time[:live], n - 1)[:n]
+        keep = np.ones(live, bool)
+        keep[oldest] = False
+        self.compact(keep)
+
+    def compact(self, keep):
+        remaining = int(np.count_nonzero(keep))
+        holes = np.flatnonzero(~keep[:remaining])
+        movers = np.flatnonzero(keep[remaining:]) + remaining
+        for column in self.columns:
+            column[holes] = column[movers]
+        self.count = remaining
+
+    def update(self, now):
+        n = self.count
+        if not n:
+            return
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        radius = self.radius[:n]
+        np.maximum(radius - 0.2, 0, out=radius)
+        alive = (now - self.spawn_time[:n]) < self.lifetime
+        if not alive.all():
+            self.compact(alive)
+
+    def bounds(self, scale_factor):
+        n = self.count
+        if not n:
+            return None
+        radius = float(self.radius[:n].max()) * min(scale_factor) + 1
+        left = float(self.x[:n].min()) * scale_factor[0] - radius
+        top = float(self.y[:n].min()) * scale_factor[1] - radius
+        right = float(self.x[:n].max()) * scale_factor[0] + radius
+        bottom = float(self.y[:n].max()) * scale_factor[1] + radius
+        return pygame.Rect(int(left), int(top), int(right - left) + 2, int(bottom - top) + 2)
+
+    def sprite(self, key):
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            color_index, radius = divmod(key, 1024)
+            sprite = pygame.Surface((radius * 2 + 1, radius * 2 + 1))
+            sprite.fill(self.COLORKEY)
+            pygame.draw.circle(sprite, self.palette[color_index], (radius, radius), radius)
+            sprite.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+            self.sprites[key] = sprite
+        return sprite
 
     def draw(self, screen, scale_factor):
-        if self.radius > 0:
-            pygame.draw.circle(screen, self.color, 
-                               (int(self.x * scale_factor[0]), int(self.y * scale_factor[1])), 
-                               int(self.radius * min(scale_factor)))
+        n = self.count
+        if not n:
+            return
+        radius = (self.radius[:n] * min(scale_factor)).astype(np.int32)
+        visible = radius > 0
+        radius = radius[visible]
+        left = (self.x[:n][visible] * scale_factor[0]).astype(np.int32) - radius
+        top = (self.y[:n][visible] * scale_factor[1]).astype(np.int32) - radius
+        keys = self.color[:n][visible].astype(np.int32) * 1024 + radius
 
-    def is_alive(self):
-        return pygame.time.get_ticks() - self.spawn_time < self.lifetime
+        sprites = {key: self.sprite(key) for key in np.unique(keys).tolist()}
+        screen.blits(
+            [(sprites[key], (x, y)) for key, x, y in zip(keys.tolist(), left.tolist(), top.tolist())],
+            False
+        )
 
-class Game:
+class GlyphAtlas:
+    CHARACTERS = "".join(chr(code) for code in range(32, 127))
+
+    def __init__(self, font, color):
+        self.advance, self.height = font.size("M")
+        self.surface = pygame.Surface((self.advance * len(self.CHARACTERS), self.height), pygame.SRCALPHA)
+        self.areas = {}
+        for index, char in enumerate(self.CHARACTERS):
+            x = index * self.advance
+            self.surface.blit(font.render(char, True, color), (x, 0))
+            self.areas[char] = pygame.Rect(x, 0, self.advance, self.height)
+
+    def size(self, text):
+        return (len(text) * self.advance, self.height)
+
+    def get_rect(self, text, **kwargs):
+        rect = pygame.Rect((0, 0), self.size(text))
+        for name, value in kwargs.items():
+            setattr(rect, name, value)
+        return rect
+
+    def draw(self, surface, text, pos):
+        x, y = pos
+        atlas = self.surface
+        areas = self.areas
+        advance = self.advance
+        surface.blits(
+            [(atlas, (x + index * advance, y), areas[char]) for index, char in enumerate(text) if char != " "],
+            False
+        )
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+class AssetBundle:
+    MAGIC = b"CEAB"
+    VERSION = 1
+    HEADER = struct.Struct("<4sII")
+    ALIGN = 16
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_length = self.HEADER.unpack_from(self.data)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{path} is not a version {self.VERSION} asset bundle")
+        index_start = self.HEADER.size
+        self.index = json.loads(self.data[index_start:index_start + index_length])
+        self.base = self.aligned(index_start + index_length)
+        self.view = memoryview(self.data)
+
+    @classmethod
+    def aligned(cls, offset):
+        return -(-offset // cls.ALIGN) * cls.ALIGN
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def blob(self, name):
+        entry = self.index[name]
+        start = self.base + entry["offset"]
+        return self.view[start:start + entry["length"]]
+
+    def image(self, name):
+        entry = self.index[name]
+        return pygame.image.frombuffer(self.blob(name), tuple(entry["size"]), entry["format"])
+
+    def sound(self, name):
+        return pygame.mixer.Sound(buffer=self.blob(name))
+
+    def bytes(self, name):
+        return bytes(self.blob(name))
+
+    def has_sound(self, name):
+        entry = self.index.get(name)
+        return entry is not None and entry["mixer"] == list(pygame.mixer.get_init())
+
+    @staticmethod
+    def digest(path):
+        return hashlib.blake2b(read_file(path), digest_size=16).hexdigest()
+
+    @classmethod
+    def stamp(cls, path):
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": cls.digest(path)}
+
+    def fresh(self, name, path):
+        entry = self.index.get(name)
+        source = entry and entry.get("source")
+        if not isinstance(source, dict):
+            return False
+        try:
+            stat = os.stat(path)
+            if stat.st_size != source["size"]:
+                return False
+            return stat.st_mtime_ns == source["mtime_ns"] or self.digest(path) == source["digest"]
+        except OSError:
+            return False
+        try:
+            return entry["source"] == self.stamp(path)
+        except OSError:
+            return False
+
+    @classmethod
+    def pack(cls, assets_path, path):
+        entries = {}
+        blobs = []
+        offset = 0
+
+        def add(name, entry, blob, source):
+            nonlocal offset
+            entry.update(offset=offset, length=len(blob), source=cls.stamp(source))
+            entries[name] = entry
+            blobs.append(blob)
+            offset = cls.aligned(offset + len(blob))
+
+        for name, parts in Game.IMAGE_FILES.items():
+            source = os.path.join(assets_path, *parts)
+            surface = pygame.image.load(source)
+            image_format = "RGB" if name in Game.OPAQUE_IMAGES else "RGBA"
+            add(name, {"kind": "image", "size": surface.get_size(), "format": image_format},
+                pygame.image.tobytes(surface, image_format), source)
+        for name, parts in Game.SOUND_FILES.items():
+            source = os.path.join(assets_path, *parts)
+            sound = pygame.mixer.Sound(source)
+            add(name, {"kind": "sound", "mixer": list(pygame.mixer.get_init())}, sound.get_raw(), source)
+        for name, parts in Game.MUSIC_FILES.items():
+            source = os.path.join(assets_path, *parts)
+            add(name, {"kind": "music"}, read_file(source), source)
+        source = os.path.join(assets_path, *Game.FONT_FILE)
+        add("font", {"kind": "font"}, read_file(source), source)
+
+        index = json.dumps(entries).encode()
+        with open(path + ".tmp", "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(index)))
+            f.write(index)
+            base = cls.aligned(f.tell())
+            for entry, blob in zip(entries.values(), blobs):
+                f.seek(base + entry["offset"])
+                f.write(blob)
+        os.replace(path + ".tmp", path)
+        return entries
+
+class Level:
+    MAGIC = b"CELV"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHqqIIIIIIII")
+    ALIGN = 16
+    SPAWN_STEP = 10
+    CACHE_SUFFIX = ".level"
+
+    def __init__(self, meta, cell_size, obstacles, spawn_cells, cell_keys, cell_offsets, cell_items):
+        self.name = meta["name"]
+        self.map = meta["map"]
+        self.size = tuple(meta["size"])
+        self.player_start = tuple(meta["player_start"])
+        self.trash_count = meta["trash"]
+        self.power_up_count = meta["power_ups"]
+        self.digest = bytes.fromhex(meta["digest"])
+        self.path = None
+        self.obstacle_rects = obstacles
+        self.spawn_cells = spawn_cells.tolist()
+        entities = [Entity(Kind.OBSTACLE, pygame.Rect(rect)) for rect in obstacles.tolist()]
+        cells = zip(map(tuple, cell_keys.tolist()), np.split(cell_items, cell_offsets[1:-1]))
+        self.obstacles = SpatialGrid.from_cells(cell_size, [(entity, entity.rect) for entity in entities],
+                                                ((key, indices.tolist()) for key, indices in cells))
+
+    @staticmethod
+    def cache_path(path):
+        return os.path.splitext(path)[0] + Level.CACHE_SUFFIX
+
+    @classmethod
+    def stamp(cls, path, cell_size, pickup_size):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size, cell_size, cls.SPAWN_STEP, pickup_size)
+
+    @classmethod
+    def open(cls, path, cell_size, pickup_size):
+        stamp = cls.stamp(path, cell_size, pickup_size)
+        cache = cls.cache_path(path)
+        level = cls.load(cache, stamp) if os.path.exists(cache) else None
+        if level is None:
+            level = cls.compile(path, cache, stamp)
+        level.path = path
+        return level
+
+    @classmethod
+    def load(cls, cache, stamp):
+        data = read_file(cache)
+        if len(data) < cls.HEADER.size:
+            return None
+        magic, version, *fields = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION or tuple(fields[:5]) != stamp:
+            return None
+        cell_size = fields[2]
+        meta_length, obstacle_count, spawn_count, cell_count, item_count = fields[5:]
+        meta_start = cls.HEADER.size
+        meta = json.loads(data[meta_start:meta_start + meta_length])
+        arrays = np.frombuffer(data, np.int32, offset=cls.aligned(meta_start + meta_length))
+        sizes = (obstacle_count * 4, spawn_count * 2, cell_count * 2, cell_count + 1, item_count)
+        obstacles, spawn_cells, cell_keys, cell_offsets, cell_items = np.split(arrays, np.cumsum(sizes)[:-1])
+        return cls(meta, cell_size, obstacles.reshape(-1, 4), spawn_cells.reshape(-1, 2),
+                   cell_keys.reshape(-1, 2), cell_offsets, cell_items)
+
+    @classmethod
+    def aligned(cls, offset):
+        return -(-offset // cls.ALIGN) * cls.ALIGN
+
+    @classmethod
+    def compile(cls, path, cache, stamp):
+        data = read_file(path)
+        source = json.loads(data)
+        _, _, cell_size, step, pickup_size = stamp
+        meta = {key: source[key] for key in ("name", "map", "size", "player_start", "trash", "power_ups")}
+        meta["digest"] = hashlib.blake2b(data, digest_size=InputLog.LEVEL_DIGEST_SIZE).hexdigest()
+        obstacles = np.array(source["obstacles"], np.int32).reshape(-1, 4)
+        spawn_cells = cls.compile_spawn_cells(obstacles, source["spawn_zones"], step, pickup_size)
+        if not len(spawn_cells):
+            raise ValueError(f"{path} has no spawn cell clear of obstacles")
+        cell_keys, cell_offsets, cell_items = cls.compile_grid(obstacles, cell_size)
+
+        encoded = json.dumps(meta).encode()
+        arrays = (obstacles, spawn_cells, cell_keys, cell_offsets, cell_items)
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, *stamp, len(encoded), len(obstacles),
+                                 len(spawn_cells), len(cell_keys), len(cell_items))
+        try:
+            with open(cache + ".tmp", "wb") as f:
+                f.write(header)
+                f.write(encoded)
+                f.write(bytes(cls.aligned(f.tell()) - f.tell()))
+                for array in arrays:
+                    f.write(np.ascontiguousarray(array, np.int32).tobytes())
+            os.replace(cache + ".tmp", cache)
+        except OSError:
+            pass
+        return cls(meta, cell_size, *arrays)
+
+    @staticmethod
+    def compile_spawn_cells(obstacles, zones, step, pickup_size):
+        found = []
+        for x, y, w, h in zones:
+            xs = np.arange(x, x + w, step, dtype=np.int32)
+            ys = np.arange(y, y + h, step, dtype=np.int32)
+            left, top, width, height = obstacles.T.astype(np.int64)
+            x0 = np.searchsorted(xs, left - pickup_size, "right")
+            x1 = np.searchsorted(xs, left + width, "left")
+            y0 = np.searchsorted(ys, top - pickup_size, "right")
+            y1 = np.searchsorted(ys, top + height, "left")
+            covered = np.zeros((len(ys) + 1, len(xs) + 1), np.int32)
+            np.add.at(covered, (y0, x0), 1)
+            np.add.at(covered, (y0, x1), -1)
+            np.add.at(covered, (y1, x0), -1)
+            np.add.at(covered, (y1, x1), 1)
+            blocked = covered.cumsum(0).cumsum(1)[:-1, :-1] > 0
+            row, column = np.nonzero(~blocked)
+            found.append(np.column_stack((xs[column], ys[row])))
+        return np.concatenate(found).astype(np.int32) if found else np.zeros((0, 2), np.int32)
+
+    @staticmethod
+    def compile_grid(obstacles, cell_size):
+        left, top, width, height = obstacles.T.astype(np.int64)
+        x0, y0 = left // cell_size, top // cell_size
+        columns = (left + width - 1) // cell_size - x0 + 1
+        rows = (top + height - 1) // cell_size - y0 + 1
+        counts = columns * rows
+        owner = np.repeat(np.arange(len(obstacles)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = x0[owner] + local % columns[owner]
+        cy = y0[owner] + local // columns[owner]
+        order = np.lexsort((owner, cy, cx))
+        cx, cy, owner = cx[order], cy[order], owner[order]
+        first = np.ones(len(order), bool)
+        first[1:] = (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])
+        starts = np.flatnonzero(first)
+        cell_keys = np.column_stack((cx[starts], cy[starts])).astype(np.int32)
+        cell_offsets = np.append(starts, len(order)).astype(np.int32)
+        return cell_keys.reshape(-1, 2), cell_offsets, owner.astype(np.int32)
+
+class AssetLoader:
+    def __init__(self, jobs, priority=(), workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1))
+        self.start_time = time.perf_counter()
+        self.futures = {}
+        for name in sorted(jobs, key=lambda name: name not in priority):
+            load, path = jobs[name]
+            self.futures[name] = self.executor.submit(self.timed, load, path)
+        self.pending = dict.fromkeys(jobs)
+        self.decode_seconds = 0.0
+
+    @staticmethod
+    def timed(load, path):
+        start = time.perf_counter()
+        value = load(path)
+        return value, time.perf_counter() - start
+
+    def progress(self):
+        return 1 - len(self.pending) / len(self.futures)
+
+    def done(self):
+        return not self.pending
+
+    def ready(self):
+        return [name for name in self.pending if self.futures[name].done()]
+
+    def take(self, name):
+        value, seconds = self.futures[name].result()
+        del self.pending[name]
+        self.decode_seconds += seconds
+        return value
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+class AssetCache:
+    FONT_BYTES = 64 * 1024
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.builds = 0
+        self.build_seconds = 0.0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def size_of(self, value):
+        if isinstance(value, pygame.Surface):
+            return value.get_width() * value.get_height() * value.get_bytesize()
+        if isinstance(value, (list, tuple)):
+            return sum(self.size_of(item) for item in value)
+        if isinstance(value, dict):
+            return sum(self.size_of(item) for item in value.values())
+        if isinstance(value, GlyphAtlas):
+            return self.size_of(value.surface)
+        return self.FONT_BYTES
+
+    def get(self, key, build):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+
+        start = time.perf_counter()
+        value = build()
+        self.build_seconds += time.perf_counter() - start
+        size = self.size_of(value)
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+        self.builds += 1
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+class IntroPlayback:
+    def __init__(self, fps, frame_count):
+        self.fps = fps
+        self.frame_count = frame_count
+        self.duration_ms = frame_count * 1000 / fps
+        self.shown_index = -1
+        self.start_time = None
+        self.stats = {
+            "decoded": 0,
+            "presented": 0,
+            "dropped": 0,
+            "repeated": 0,
+            "drift_ms": 0.0,
+            "max_drift_ms": 0.0,
+        }
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        pass
+
+    def clock_ms(self):
+        position = pygame.mixer.music.get_pos()
+        if position >= 0:
+            return position
+        return (time.perf_counter() - self.start_time) * 1000
+
+    def target_frame(self, position):
+        return int(position * self.fps / 1000)
+
+    def record_drift(self, position):
+        drift = position - self.shown_index * 1000 / self.fps
+        self.stats["drift_ms"] = drift
+        self.stats["max_drift_ms"] = max(self.stats["max_drift_ms"], abs(drift))
+
+    def finished(self):
+        return self.clock_ms() >= self.duration_ms
+
+class IntroPlayer(IntroPlayback):
+    BUFFER_FRAMES = 8
+
+    def __init__(self, video_path, size):
+        import cv2
+        self.cap = cv2.VideoCapture(video_path)
+        super().__init__(
+            self.cap.get(cv2.CAP_PROP_FPS) or 30,
+            int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        )
+        self.size = size
+
+        width, height = size
+        self.slots = np.empty((self.BUFFER_FRAMES, height, width, 3), np.uint8)
+        self.scratch = np.empty((height, width, 3), np.uint8)
+        self.surface = pygame.Surface(size)
+        self.free_slots = queue.Queue()
+        for slot in range(self.BUFFER_FRAMES):
+            self.free_slots.put(slot)
+        self.ready = queue.Queue()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.decode, daemon=True)
+        self.decoded_all = False
+
+    def start(self):
+        super().start()
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join(timeout=1)
+
+    def decode(self):
+        import cv2
+        index = 0
+        while not self.stopping.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            slot = None
+            while slot is None and not self.stopping.is_set():
+                try:
+                    slot = self.free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if slot is None:
+                break
+            cv2.resize(frame, self.size, dst=self.scratch)
+            cv2.cvtColor(self.scratch, cv2.COLOR_BGR2RGB, dst=self.slots[slot])
+            self.ready.put((index, slot))
+            self.stats["decoded"] += 1
+            index += 1
+        self.cap.release()
+        self.ready.put(None)
+
+    def advance(self):
+        position = self.clock_ms()
+        target = self.target_frame(position)
+        presented = None
+        while self.shown_index < target and not self.decoded_all:
+            try:
+                item = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.decoded_all = True
+                break
+            if presented is not None:
+                self.free_slots.put(presented)
+                self.stats["dropped"] += 1
+            self.shown_index, presented = item
+
+        if presented is not None:
+            pygame.surfarray.blit_array(self.surface, self.slots[presented].swapaxes(0, 1))
+            self.free_slots.put(presented)
+            self.stats["presented"] += 1
+        elif self.shown_index < target and not self.decoded_all:
+            self.stats["repeated"] += 1
+
+        self.record_drift(position)
+        return self.surface
+
+    def present(self, screen):
+        frame_surface = self.advance()
+        if frame_surface.get_size() != screen.get_size():
+            frame_surface = pygame.transform.scale(frame_surface, screen.get_size())
+        screen.blit(frame_surface, (0, 0))
+
+    def finished(self):
+        return super().finished() or (self.decoded_all and self.ready.empty())
+
+class BakedIntroPlayer(IntroPlayback):
+    MAGIC = b"CEIV"
+    HEADER = struct.Struct("<4sIIIf12x")
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, width, height, frame_count, fps = self.HEADER.unpack(f.read(self.HEADER.size))
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a baked intro file")
+        if frame_count == 0:
+            raise ValueError(f"{path} has no frames")
+        super().__init__(fps, frame_count)
+        self.size = (width, height)
+        self.frames = np.memmap(path, np.uint8, "r", offset=self.HEADER.size,
+                                shape=(frame_count, width, height, 3))
+
+    @staticmethod
+    def path_for(cache_dir, size):
+        return os.path.join(cache_dir, f"intro_{size[0]}x{size[1]}.rgb")
+
+    def present(self, screen):
+        position = self.clock_ms()
+        target = min(self.target_frame(position), self.frame_count - 1)
+        if target > self.shown_index:
+            if self.shown_index >= 0:
+                self.stats["dropped"] += target - self.shown_index - 1
+            self.shown_index = target
+            self.stats["presented"] += 1
+        frame = self.frames[self.shown_index]
+        if self.size == screen.get_size():
+            pygame.surfarray.blit_array(screen, frame)
+        else:
+            screen.blit(pygame.transform.scale(pygame.surfarray.make_surface(frame), screen.get_size()), (0, 0))
+        self.record_drift(position)
+
+class Overlays:
+    def __init__(self):
+        self.size = None
+        self.surfaces = {}
+
+    def get(self, size, color, alpha):
+        if size != self.size:
+            self.size = size
+            self.surfaces.clear()
+        surface = self.surfaces.get(color)
+        if surface is None:
+            surface = pygame.Surface(size).convert()
+            surface.fill(color)
+            self.surfaces[color] = surface
+        surface.set_alpha(alpha)
+        return surface
+
+class Fade:
+    def __init__(self, background, start_alpha, end_alpha, duration=500, color=(0, 0, 0)):
+        self.background = background
+        self.start_alpha = start_alpha
+        self.end_alpha = end_alpha
+        self.duration = duration
+        self.color = color
+        self.start_time = 0
+
+    def start(self, game):
+        self.start_time = game.get_ticks()
+
+    def progress(self, game):
+        return min(1.0, (game.get_ticks() - self.start_time) / self.duration)
+
+    def update(self, game):
+        return self.progress(game) >= 1.0
+
+    def handle_event(self, game, event):
+        pass
+
+    def draw(self, game):
+        alpha = int(self.start_alpha + (self.end_alpha - self.start_alpha) * self.progress(game))
+        game.screen.blit(getattr(game, self.background), (0, 0))
+        game.screen.blit(game.overlays.get((game.WIDTH, game.HEIGHT), self.color, alpha), (0, 0))
+
+    def finish(self, game):
+        pass
+
+class IntroTransition:
+    def __init__(self, video_path, music):
+        self.video_path = video_path
+        self.music = music
+        self.player = None
+        self.skipped = False
+
+    def start(self, game):
+        self.player = game.open_intro(self.video_path)
+        game.audio.play_music(self.music)
+        self.player.start()
+
+    def update(self, game):
+        return self.skipped or self.player.finished()
+
+    def handle_event(self, game, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            self.skipped = True
+
+    def draw(self, game):
+        self.player.present(game.screen)
+        game.screen.blit(game.cached_text("Press ESC to skip...", 24, (255, 165, 0)), (20, 20))
+
+    def finish(self, game):
+        self.player.stop()
+        game.audio.stop_music(game.MUSIC_FADE_MS)
+        game.stats["intro"] = self.player.stats
+
+class AudioManager:
+    def __init__(self, channels=8):
+        pygame.mixer.set_num_channels(channels)
+        pygame.mixer.set_reserved(channels)
+        self.channels = [pygame.mixer.Channel(index) for index in range(channels)]
+        self.started = [0] * channels
+        self.sounds = {}
+        self.limits = {}
+        self.voices = {}
+        self.last_played = {}
+        self.music = {}
+        self.pending_music = None
+        self.music_clock = None
+        self.buffer_ms = 0.0
+        self.stats = {
+            "played": 0,
+            "stolen": 0,
+            "rate_limited": 0,
+            "music_loads": 0,
+            "underruns": 0,
+            "underrun_ms": 0.0,
+        }
+
+    def configure(self, frequency, buffer):
+        self.buffer_ms = buffer / frequency * 1000
+        self.stats.update(frequency=frequency, buffer=buffer, latency_ms=self.buffer_ms)
+
+    def add_sound(self, name, sound, max_voices, min_interval_ms):
+        self.sounds[name] = sound
+        self.limits[name] = (max_voices, min_interval_ms)
+        self.voices[name] = deque()
+
+    def add_music(self, name, data):
+        self.music[name] = data
+
+    def play(self, name, now):
+        max_voices, min_interval = self.limits[name]
+        last = self.last_played.get(name)
+        if last is not None and now - last < min_interval:
+            self.stats["rate_limited"] += 1
+            return None
+        self.last_played[name] = now
+
+        sound = self.sounds[name]
+        voices = self.voices[name] = deque(
+            channel for channel in self.voices[name] if channel.get_busy() and channel.get_sound() is sound
+        )
+        if len(voices) >= max_voices:
+            channel = voices.popleft()
+            self.stats["stolen"] += 1
+        else:
+            channel = self.free_channel()
+        channel.play(sound)
+        self.started[self.channels.index(channel)] = now
+        voices.append(channel)
+        self.stats["played"] += 1
+        return channel
+
+    def free_channel(self):
+        for channel in self.channels:
+            if not channel.get_busy():
+                return channel
+        self.stats["stolen"] += 1
+        oldest = min(range(len(self.channels)), key=self.started.__getitem__)
+        return self.channels[oldest]
+
+    def play_music(self, name, loops=0, fade_ms=0, volume=1.0):
+        self.pending_music = (name, loops, fade_ms, volume)
+        if fade_ms and pygame.mixer.music.get_busy():
+            pygame.mixer.music.fadeout(fade_ms)
+            return
+        self.start_pending_music()
+
+    def stop_music(self, fade_ms=0):
+        self.pending_music = None
+        if fade_ms:
+            pygame.mixer.music.fadeout(fade_ms)
+        else:
+            pygame.mixer.music.stop()
+        self.music_clock = None
+
+    def start_pending_music(self):
+        name, loops, fade_ms, volume = self.pending_music
+        self.pending_music = None
+        pygame.mixer.music.load(io.BytesIO(self.music[name]), "mp3")
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(loops=loops, fade_ms=fade_ms)
+        self.stats["music_loads"] += 1
+        self.music_clock = None
+
+    def update(self):
+        if self.pending_music and not pygame.mixer.music.get_busy():
+            self.start_pending_music()
+            return
+        position = pygame.mixer.music.get_pos()
+        if position < 0 or not pygame.mixer.music.get_busy():
+            self.music_clock = None
+            return
+        now = time.perf_counter() * 1000
+        if self.music_clock is not None:
+            last_now, last_position = self.music_clock
+            deficit = (now - last_now) - (position - last_position)
+            if deficit > self.buffer_ms:
+                self.stats["underruns"] += 1
+                self.stats["underrun_ms"] += deficit
+        self.music_clock = (now, position)
+
+class Button:
+    def __init__(self, screen, on_click):
+        self.screen = screen
+        self.on_click = on_click
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+class UI:
+    def __init__(self):
+        self.buttons = {}
+        self.screen = None
+        self.hovered = None
+        self.cursor = None
+
+    def add(self, name, screen, on_click):
+        self.buttons[name] = Button(screen, on_click)
+
+    def place(self, name, rect):
+        self.buttons[name].rect = rect
+
+    def hit(self, pos):
+        for button in self.buttons.values():
+            if button.screen == self.screen and button.rect.collidepoint(pos):
+                return button
+        return None
+
+    def hover(self, pos):
+        hovered = self.hit(pos)
+        if hovered is not self.hovered:
+            self.hovered = hovered
+            self.set_cursor(pygame.SYSTEM_CURSOR_HAND if hovered else pygame.SYSTEM_CURSOR_ARROW)
+
+    def set_cursor(self, cursor):
+        if cursor == self.cursor:
+            return
+        self.cursor = cursor
+        try:
+            pygame.mouse.set_cursor(cursor)
+        except pygame.error:
+            pass
+
+    def set_screen(self, screen, pos):
+        self.screen = screen
+        self.hover(pos)
+
+    def handle_event(self, event):
+        if event.type == pygame.MOUSEMOTION:
+            self.hover(event.pos)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            button = self.hit(event.pos)
+            if button:
+                button.on_click()
+                return True
+        return False
+
+class Profiler:
+    HISTORY = 600
+    REFRESH_FRAMES = 30
+
+    def __init__(self, trace=False):
+        self.origin = time.perf_counter()
+        self.trace = [] if trace else None
+        self.frame_totals = {}
+        self.samples = {}
+        self.frame_start = None
+        self.frames = 0
+        self.show_overlay = False
+        self.lines = ["profiling..."]
+
+    def wrap(self, func, name):
+        totals = self.frame_totals
+        trace = self.trace
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            end = time.perf_counter()
+            totals[name] = totals.get(name, 0.0) + (end - start)
+            if trace is not None:
+                trace.append((name, start, end))
+            return result
+        return wrapper
+
+    def instrument(self, obj, names, prefix=""):
+        for name in names:
+            setattr(obj, name, self.wrap(getattr(obj, name), prefix + name))
+
+    def record(self, name, seconds):
+        history = self.samples.get(name)
+        if history is None:
+            history = self.samples[name] = deque(maxlen=self.HISTORY)
+        history.append(seconds * 1000)
+
+    def end_frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.record("frame", now - self.frame_start)
+            if self.trace is not None:
+                self.trace.append(("frame", self.frame_start, now))
+        self.frame_start = now
+        for name, seconds in self.frame_totals.items():
+            self.record(name, seconds)
+        self.frame_totals.clear()
+
+        self.frames += 1
+        if self.show_overlay and self.frames % self.REFRESH_FRAMES == 0:
+            self.lines = self.format_lines()
+
+    def percentiles(self):
+        return {
+            name: dict(zip(("p50", "p95", "p99"), np.percentile(np.fromiter(history, np.float64, len(history)), (50, 95, 99)).tolist()))
+            for name, history in self.samples.items()
+        }
+
+    def format_lines(self):
+        lines = [f"{'ms':<20}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for name, values in self.percentiles().items():
+            lines.append(f"{name:<20}{values['p50']:>7.2f}{values['p95']:>7.2f}{values['p99']:>7.2f}")
+        return lines
+
+    def dump_trace(self, path):
+        events = [
+            {"name": name, "ph": "X", "pid": 0, "tid": 0,
+             "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6}
+            for name, start, end in self.trace or ()
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+class FramePacer:
+    QUALITY_LEVELS = (1.0, 0.5, 0.25)
+    WINDOW = 30
+    MAX_STEPS = 5
+
+    def __init__(self, step_ms, fps=60, vsync=False):
+        self.clock = pygame.time.Clock()
+        self.step_ms = step_ms
+        self.fps = fps
+        self.vsync = vsync
+        self.budget_ms = 1000 / (fps or 60)
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.level = 0
+        self.last_work_ms = 0
+        self.work_ms = deque(maxlen=self.WINDOW)
+        self.stats = {
+            "fps": 0.0,
+            "frames": 0,
+            "steps": 0,
+            "max_steps_per_frame": 0,
+            "dropped_ms": 0.0,
+            "quality": 1.0,
+            "quality_changes": 0,
+        }
+
+    @property
+    def quality(self):
+        return self.QUALITY_LEVELS[self.level]
+
+    def tick(self):
+        elapsed = self.clock.tick(0 if self.vsync else self.fps)
+        self.last_work_ms = self.clock.get_rawtime()
+        self.adapt(self.last_work_ms)
+
+        limit = self.step_ms * self.MAX_STEPS
+        if elapsed > limit:
+            self.stats["dropped_ms"] += elapsed - limit
+            elapsed = limit
+        self.accumulator += elapsed
+        steps = int(self.accumulator // self.step_ms)
+        self.accumulator -= steps * self.step_ms
+        self.alpha = self.accumulator / self.step_ms
+
+        stats = self.stats
+        stats["fps"] = self.clock.get_fps()
+        stats["frames"] += 1
+        stats["steps"] += steps
+        stats["max_steps_per_frame"] = max(stats["max_steps_per_frame"], steps)
+        return steps
+
+    def adapt(self, work_ms):
+        samples = self.work_ms
+        samples.append(work_ms)
+        if len(samples) < samples.maxlen:
+            return
+        average = sum(samples) / len(samples)
+        if average > self.budget_ms and self.level < len(self.QUALITY_LEVELS) - 1:
+            self.level += 1
+        elif average < self.budget_ms / 2 and self.level > 0:
+            self.level -= 1
+        else:
+            return
+        samples.clear()
+        self.stats["quality"] = self.quality
+        self.stats["quality_changes"] += 1
+
+def bake_intro(video_path, sizes, cache_dir):
+    import cv2
+    os.makedirs(cache_dir, exist_ok=True)
+    for width, height in sizes:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"cannot open {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        path = BakedIntroPlayer.path_for(cache_dir, (width, height))
+        frame_count = 0
+        with open(path + ".tmp", "wb") as f:
+            f.write(bytes(BakedIntroPlayer.HEADER.size))
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame = cv2.cvtColor(cv2.resize(frame, (width, height)), cv2.COLOR_BGR2RGB)
+                f.write(np.ascontiguousarray(frame.swapaxes(0, 1)).tobytes())
+                frame_count += 1
+            f.seek(0)
+            f.write(BakedIntroPlayer.HEADER.pack(BakedIntroPlayer.MAGIC, width, height, frame_count, fps))
+        cap.release()
+        if frame_count == 0:
+            os.remove(path + ".tmp")
+            raise ValueError(f"decoded no frames from {video_path}")
+        os.replace(path + ".tmp", path)
+        print(f"baked {frame_count} frames at {width}x{height} -> {path}")
+
+class Simulation:
     BASE_WIDTH, BASE_HEIGHT = 1600, 900
     PLAYER_SIZE = 180
     PICKUP_SIZE = 130
-    FLASH_DURATION = 100
     ANIMATION_DELAY = 100
+    WALK_FRAMES = 3
     BOOST_DURATION = 3000
     DEFAULT_SPEED = 4
     BOOSTED_SPEED = 8
+    GRID_CELL_SIZE = 200
+    TRASH_KINDS = (Kind.TRASH1, Kind.TRASH2, Kind.TRASH3, Kind.TRASH4)
+    POWER_UP_KINDS = (Kind.SHAWARMA, Kind.LEMON)
+    DEFAULT_LEVEL = os.path.join("assets", "levels", "classroom.json")
+
+    def __init__(self, level, seed=None):
+        self.level = level
+        self.seed = seed if seed is not None else random.randrange(1 << 63)
+        self.rng = random.Random(self.seed)
+        self.now = 0
+        self.collected = []
+        self.bounds = pygame.Rect((0, 0), level.size)
+
+        self.score = 0
+        self.power_ups_used = 0
+        self.start_ticks = None
+        self.end_ticks = None
+
+        self.player = self.new_player()
+        self.player_speed = self.DEFAULT_SPEED
+        self.animation_index = 1
+        self.animation_timer = 0
+
+        self.power_up_active = False
+        self.power_up_timer = 0
+
+        self.obstacles = level.obstacles
+        self.spawn_trash_items()
+        self.spawn_power_ups()
+
+    @property
+    def finished(self):
+        return self.score >= self.level.trash_count
+
+    def reseed(self, seed):
+        self.seed = seed
+        self.rng.seed(seed)
+
+    def new_grid(self):
+        return SpatialGrid(self.GRID_CELL_SIZE)
+
+    @classmethod
+    def load_level(cls, path=None):
+        path = path or cls.DEFAULT_LEVEL
+        level = Level.open(path, cls.GRID_CELL_SIZE, cls.PICKUP_SIZE)
+        if level.size != (cls.BASE_WIDTH, cls.BASE_HEIGHT):
+            raise ValueError(f"{path} is {level.size[0]}x{level.size[1]}; levels must be {cls.BASE_WIDTH}x{cls.BASE_HEIGHT}")
+        return level
+
+    def new_player(self):
+        self.player_previous = self.level.player_start
+        return Entity(Kind.PLAYER, pygame.Rect(self.level.player_start, (self.PLAYER_SIZE, self.PLAYER_SIZE)))
+
+    def spawn_position(self):
+        cells = self.level.spawn_cells
+        return cells[self.rng.randrange(len(cells))]
+
+    def spawn_trash_items(self):
+        self.trash_items = self.new_grid()
+        for _ in range(self.level.trash_count):
+            x, y = self.spawn_position()
+            img_index = self.rng.randint(0, len(self.TRASH_KINDS) - 1)
+            trash = Entity(self.TRASH_KINDS[img_index], pygame.Rect(x, y, self.PICKUP_SIZE, self.PICKUP_SIZE))
+            self.trash_items.insert(trash, trash.rect)
+
+    def spawn_power_ups(self):
+        self.power_ups = self.new_grid()
+        for _ in range(self.level.power_up_count):
+            x, y = self.spawn_position()
+            kind = self.rng.choice(self.POWER_UP_KINDS)
+            power_up = Entity(kind, pygame.Rect(x, y, self.PICKUP_SIZE, self.PICKUP_SIZE))
+            self.power_ups.insert(power_up, power_up.rect)
+
+    def reset(self, now):
+        self.now = now
+        self.collected.clear()
+        self.score = 0
+        self.power_ups_used = 0
+        self.start_ticks = now
+        self.end_ticks = None
+        self.spawn_trash_items()
+        self.spawn_power_ups()
+        self.power_up_active = False
+        self.player_speed = self.DEFAULT_SPEED
+        self.player = self.new_player()
+
+    def elapsed_seconds(self, now):
+        if self.start_ticks is None:
+            return 0.0
+        end = self.end_ticks if self.end_ticks is not None else now
+        return (end - self.start_ticks) / 1000
+
+    def step(self, keys, dt, now):
+        self.now = now
+        self.player_previous = self.player.rect.topleft
+        moving = self.handle_player_movement(keys)
+        self.update_animation(moving, dt)
+        self.handle_collisions()
+        self.update_power_up_status()
+
+    def handle_player_movement(self, keys):
+        if self.finished:
+            return False
+            
+        moving = False
+        dx = dy = 0
+        
+        if keys[pygame.K_LEFT]:
+            dx -= self.player_speed
+            moving = True
+        if keys[pygame.K_RIGHT]:
+            dx += self.player_speed
+            moving = True
+        if keys[pygame.K_UP]:
+            dy -= self.player_speed
+            moving = True
+        if keys[pygame.K_DOWN]:
+            dy += self.player_speed
+            moving = True
+
+        player_rect = self.player.rect
+        if dx:
+            self.sweep(player_rect, dx, 0)
+        if dy:
+            self.sweep(player_rect, 0, dy)
+        
+        return moving
+
+    def sweep(self, rect, dx, dy):
+        target = rect.move(dx, dy).clamp(self.bounds)
+        for obstacle in self.obstacles.query(rect.union(target)):
+            other = obstacle.rect
+            if other.colliderect(rect):
+                continue
+            if dx > 0:
+                target.right = min(target.right, other.left)
+            elif dx < 0:
+                target.left = max(target.left, other.right)
+            elif dy > 0:
+                target.bottom = min(target.bottom, other.top)
+            else:
+                target.top = max(target.top, other.bottom)
+        rect.topleft = target.topleft
     
-    def __init__(self):
+    def update_animation(self, moving, dt):
+        if moving:
+            self.animation_timer += dt
+            if self.animation_timer >= self.ANIMATION_DELAY:
+                self.animation_index = (self.animation_index + 1) % self.WALK_FRAMES
+                self.animation_timer = 0
+        else:
+            self.animation_index = 1
+    
+    def handle_collisions(self):
+        for trash in self.trash_items.query(self.player.rect):
+            self.trash_items.remove(trash)
+            self.collected.append(trash)
+            self.score += 1
+
+        for power_up in self.power_ups.query(self.player.rect):
+            self.power_ups.remove(power_up)
+            self.collected.append(power_up)
+            self.power_ups_used += 1
+            self.power_up_active = True
+            self.power_up_timer = self.now
+            self.player_speed = self.BOOSTED_SPEED
+
+        if self.finished and self.end_ticks is None:
+            self.end_ticks = self.now
+    
+    def update_power_up_status(self):
+        if self.power_up_active and self.now - self.power_up_timer > self.BOOST_DURATION:
+            self.power_up_active = False
+            self.player_speed = self.DEFAULT_SPEED
+
+    def state_hash(self):
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(struct.pack("<4iiiB?", *self.player.rect, self.score, self.player_speed,
+                                  self.animation_index, self.power_up_active))
+        for item in itertools.chain(self.trash_items, self.power_ups):
+            digest.update(struct.pack("<4iB", *item.rect, item.kind))
+        return digest.hexdigest()
+
+class Game:
+    BASE_WIDTH, BASE_HEIGHT = Simulation.BASE_WIDTH, Simulation.BASE_HEIGHT
+    PLAYER_SIZE = Simulation.PLAYER_SIZE
+    PICKUP_SIZE = Simulation.PICKUP_SIZE
+    FLASH_DURATION = 100
+    FIXED_DT = 1000 / 60
+    TARGET_FPS = 60
+    PARTICLE_BUDGET = 2000
+    PARTICLE_BURST = 15
+    AUDIO_FREQUENCY = 44100
+    AUDIO_BUFFER = 512
+    SFX_CHANNELS = 8
+    MUSIC_FADE_MS = 400
+    RESIZE_SETTLE_MS = 100
+    USE_RLE = True
+    IMAGE_FILES = {
+        "menu": ("menu.png",),
+        "map": ("map.png",),
+        "score_board": ("score_board.png",),
+        "walk1": ("student", "walk1.png"),
+        "walk2": ("student", "walk2.png"),
+        "walk3": ("student", "walk3.png"),
+        "shawarma": ("powerups", "shawarma.png"),
+        "lemon": ("powerups", "lemon.png"),
+        "trash1": ("trash", "trash1.png"),
+        "trash2": ("trash", "trash2.png"),
+        "trash3": ("trash", "trash3.png"),
+        "trash4": ("trash", "trash4.png"),
+    }
+    SOUND_FILES = {
+        "broom_sweep": ("sound effects", "broom_sweep.mp3"),
+        "pickup": ("sound effects", "pick-up.mp3"),
+    }
+    MUSIC_FILES = {
+        "intro_audio": ("intro_audio.mp3",),
+        "background_music": ("background_music.mp3",),
+    }
+    SOUND_LIMITS = {
+        "broom_sweep": (3, 40),
+        "pickup": (2, 80),
+    }
+    FONT_FILE = ("fonts", "PressStart2P-Regular.ttf")
+    OPAQUE_IMAGES = ("menu", "map")
+    PROFILED_SECTIONS = (
+        "poll_assets",
+        "update_particles",
+        "process_events",
+        "update_transition",
+        "update",
+        "render",
+        "render_game",
+        "draw_game_screen",
+        "sprite_blits",
+        "draw_flash_effect",
+        "draw_score_board",
+    )
+    PROFILER_FONT_SIZE = 20
+    BUNDLE_FILE = "assets.bundle"
+    TELEMETRY_FILE = "sessions.log"
+    LEADERBOARD_SIZE = 3
+    WALK_SPRITES = ("walk1", "walk2", "walk3")
+    KIND_SPRITES = {
+        Kind.TRASH1: "trash1",
+        Kind.TRASH2: "trash2",
+        Kind.TRASH3: "trash3",
+        Kind.TRASH4: "trash4",
+        Kind.SHAWARMA: "shawarma",
+        Kind.LEMON: "lemon",
+    }
+    POWER_UP_COLORS = {
+        Kind.SHAWARMA: (144, 238, 144),
+        Kind.LEMON: (255, 165, 0),
+    }
+    
+    def __init__(self, headless=False, seed=None, audio_frequency=None, audio_buffer=None, level=None, fps=None, vsync=False,
+                 telemetry=None):
+        self.headless = headless
+        start = time.perf_counter()
+        self.level = Simulation.load_level(level)
+        level_ms = (time.perf_counter() - start) * 1000
+        self.sim = Simulation(self.level, seed)
+        if self.headless:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+        self.stats = {}
+        self.startup_stats = self.stats["startup"] = {"import_ms": IMPORT_SECONDS * 1000, "level_ms": level_ms}
+
+        self.audio_frequency = audio_frequency or self.AUDIO_FREQUENCY
+        self.audio_buffer = audio_buffer or self.AUDIO_BUFFER
+        pygame.mixer.pre_init(self.audio_frequency, -16, 2, self.audio_buffer)
+
+        start = time.perf_counter()
         pygame.init()
+        self.startup_stats["pygame_init_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
         pygame.mixer.init()
+        self.startup_stats["mixer_init_ms"] = (time.perf_counter() - start) * 1000
+        self.audio = AudioManager(self.SFX_CHANNELS)
+        self.audio.configure(pygame.mixer.get_init()[0], self.audio_buffer)
+        self.stats["audio"] = self.audio.stats
 
+        start = time.perf_counter()
         self.WIDTH, self.HEIGHT = self.BASE_WIDTH, self.BASE_HEIGHT
-        self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT), pygame.RESIZABLE)
+        self.scaled_display = False
+        vsync = self.open_display(vsync)
         pygame.display.set_caption("CLEAN Ers")
-        self.clock = pygame.time.Clock()
+        self.pacer = FramePacer(self.FIXED_DT, self.TARGET_FPS if fps is None else fps, vsync)
+        self.stats["frames"] = self.pacer.stats
+        self.stats["frames"]["vsync"] = vsync
+        self.startup_stats["display_ms"] = (time.perf_counter() - start) * 1000
 
-        self.scale_x = 1.0
-        self.scale_y = 1.0
+        self.view = View((self.BASE_WIDTH, self.BASE_HEIGHT))
 
-        self.game_running = False
-        self.score = 0
-        self.start_time = None
-        self.end_time = None
-        self.elapsed_time = 0
+        self.sim_ticks = 0
+        self.render_alpha = 1.0
+        self.input_keys = None
+        self.recorder = None
 
-        self.player_pos = pygame.Rect(100, 100, self.PLAYER_SIZE, self.PLAYER_SIZE)
-        self.player_speed = self.DEFAULT_SPEED
-        self.animation_index = 1
-        self.animation_timer = 0
+        self.assets = AssetCache()
+
+        self.overlays = Overlays()
+        self.transition = None
+        self.transitions = deque()
+        self.on_transitions_done = None
+
+        self.profiler = None
+        self.dirty_rendering = True
+        self.full_redraw = True
+        self.previous_rects = []
+        self.removed_rects = []
+        self.render_stats = self.stats["render"] = {
+            "frames": 0,
+            "full_frames": 0,
+            "blit_bytes": 0,
+            "last_blit_bytes": 0,
+            "render_ms": 0.0,
+        }
+        self.pending_size = None
+        self.last_resize_event = 0
+
+        self.game_running = False
 
-        self.power_up_active = False
-        self.power_up_timer = 0
+        self.particles = ParticlePool(seed=self.sim.seed)
+        self.set_quality(1.0)
 
-        self.particles = []
+        self.telemetry = None
+        self.leaderboard = None
+        self.session_logged = True
+        self.session_frames = []
+        if telemetry:
+            self.telemetry = TelemetryWriter(telemetry)
+            self.stats["telemetry"] = self.telemetry.stats
+            self.leaderboard = Leaderboard(telemetry)
+            self.leaderboard.refresh()
         self.flash_alpha = 0
         self.flash_start_time = None
 
         self.exit_button_rect = pygame.Rect(600, 677, 390, 80)
         self.start_button_rect = pygame.Rect(590, 520, 400, 100)
-        self.default_cursor = pygame.SYSTEM_CURSOR_ARROW
-        self.hand_cursor = pygame.SYSTEM_CURSOR_HAND
+        self.ui = UI()
+        self.ui.add("start", "menu", self.click_start)
+        self.ui.add("exit", "menu", self.click_exit)
+        self.ui.add("try_again", "score_board", self.reset_game)
 
         self.try_again_offsets = {
             'x1': 176,
@@ -83,438 +1816,420 @@ class Game:
         }
 
         self.load_assets()
-        self.init_game_elements()
+        if self.headless:
+            self.poll_assets(wait=True)
+
+    def open_display(self, vsync):
+        size = (self.WIDTH, self.HEIGHT)
+        if vsync:
+            try:
+                self.screen = pygame.display.set_mode(size, pygame.RESIZABLE | pygame.SCALED, vsync=1)
+                self.scaled_display = True
+            except pygame.error:
+                pass
+        if not self.scaled_display:
+            self.screen = pygame.display.set_mode(size, pygame.RESIZABLE)
+            return False
+        is_vsync = getattr(pygame.display, "is_vsync", None)
+        return bool(is_vsync and is_vsync())
+
+    def get_ticks(self):
+        return int(self.sim_ticks)
+
+    def get_pressed_keys(self):
+        if self.input_keys is not None:
+            return self.input_keys
+        return pygame.key.get_pressed()
     
+    def asset_path(self, *parts):
+        return os.path.join(self.ASSETS_PATH, *parts)
+
     def load_assets(self):
         self.ASSETS_PATH = "assets"
+        self.FONT_PATH = self.asset_path(*self.FONT_FILE)
+        self.INTRO_CACHE_PATH = self.asset_path("intro_cache")
 
-        self.original_menu_img = pygame.image.load(os.path.join(self.ASSETS_PATH, "menu.png"))
-        self.original_map_img = pygame.image.load(os.path.join(self.ASSETS_PATH, "map.png"))
-        self.original_score_board_img = pygame.image.load(os.path.join(self.ASSETS_PATH, "score_board.png"))
+        self.original_images = {}
+        self.font_data = None
+        self.assets_ready = False
+        self.display_format = self.current_display_format()
+        self.startup_stats["convert_ms"] = 0.0
 
-        self.menu_img = pygame.transform.scale(self.original_menu_img, (self.WIDTH, self.HEIGHT))
-        self.map_img = pygame.transform.scale(self.original_map_img, (self.WIDTH, self.HEIGHT))
+        self.bundle = None
+        if os.path.exists(self.asset_path(self.BUNDLE_FILE)):
+            self.bundle = AssetBundle(self.asset_path(self.BUNDLE_FILE))
+        self.startup_stats["bundle"] = self.bundle is not None
 
-        orig_sb_width = self.original_score_board_img.get_width()
-        orig_sb_height = self.original_score_board_img.get_height()
-        sb_aspect_ratio = orig_sb_width / orig_sb_height
+        self.loader = AssetLoader(self.asset_jobs(), priority=("menu", "font"))
 
-        scaled_sb_height = int(self.HEIGHT * 0.7) 
-        scaled_sb_width = int(scaled_sb_height * sb_aspect_ratio)
-        
-        self.score_board_img = pygame.transform.scale(
-            self.original_score_board_img, 
-            (scaled_sb_width, scaled_sb_height)
-        )
+        self.store_asset("menu", self.loader.take("menu"))
+        self.store_asset("font", self.loader.take("font"))
 
-        font_path = os.path.join('assets', 'fonts', 'PressStart2P-Regular.ttf')
-        self.font = pygame.font.Font(font_path, 50)
-        self.small_font = pygame.font.Font(font_path, 24)
+    def asset_jobs(self):
+        bundle = self.bundle
+        jobs = {}
+        counts = {"bundle_assets": 0, "bundle_fallbacks": 0}
 
-        self.broom_sweep_sound = pygame.mixer.Sound(os.path.join(self.ASSETS_PATH, "sound effects", "broom_sweep.mp3"))
-        self.pickup_sound = pygame.mixer.Sound(os.path.join(self.ASSETS_PATH, "sound effects", "pick-up.mp3"))
+        def add(name, path, usable, bundle_load, file_load):
+            if bundle and usable and bundle.fresh(name, path):
+                jobs[name] = (bundle_load, name)
+                counts["bundle_assets"] += 1
+            else:
+                jobs[name] = (file_load, path)
+                counts["bundle_fallbacks"] += bundle is not None
 
-        self.original_student_walk_frames = [
-            pygame.image.load(os.path.join(self.ASSETS_PATH, "student", f"walk{i}.png"))
-            for i in range(1, 4)
-        ]
+        for name, parts in self.image_files().items():
+            add(name, self.asset_path(*parts), parts == self.IMAGE_FILES[name], bundle and bundle.image, pygame.image.load)
+        for name, parts in self.SOUND_FILES.items():
+            add(name, self.asset_path(*parts), bundle and bundle.has_sound(name), bundle and bundle.sound, pygame.mixer.Sound)
+        for name, parts in self.MUSIC_FILES.items():
+            add(name, self.asset_path(*parts), True, bundle and bundle.bytes, read_file)
+        add("font", self.FONT_PATH, True, bundle and bundle.bytes, read_file)
+        self.startup_stats.update(counts)
+        return jobs
 
-        self.student_walk_frames = [
-            pygame.transform.scale(frame, (int(self.PLAYER_SIZE * self.scale_x), int(self.PLAYER_SIZE * self.scale_y)))
-            for frame in self.original_student_walk_frames
-        ]
+    def image_files(self):
+        return dict(self.IMAGE_FILES, map=tuple(self.level.map.split("/")))
+
+    def store_asset(self, name, value):
+        if name in self.IMAGE_FILES:
+            start = time.perf_counter()
+            self.original_images[name] = self.convert_image(name, value)
+            self.startup_stats["convert_ms"] += (time.perf_counter() - start) * 1000
+        elif name in self.SOUND_FILES:
+            self.audio.add_sound(name, value, *self.SOUND_LIMITS[name])
+        elif name in self.MUSIC_FILES:
+            self.audio.add_music(name, value)
+        else:
+            self.font_data = value
+
+    def poll_assets(self, wait=False):
+        if self.assets_ready:
+            return True
+        names = list(self.loader.pending) if wait else self.loader.ready()
+        for name in names:
+            self.store_asset(name, self.loader.take(name))
+        if not self.loader.done():
+            return False
+
+        self.loader.shutdown()
+        self.assets_ready = True
+        self.layout_ui()
+
+        self.startup_stats["decode_ms"] = self.loader.decode_seconds * 1000
+        self.startup_stats["load_wall_ms"] = (time.perf_counter() - self.loader.start_time) * 1000
+        self.startup_stats["scale_ms"] = self.assets.build_seconds * 1000
+        self.startup_stats["assets_ready_ms"] = (time.perf_counter() - IMPORT_START) * 1000
+        return True
+
+    @property
+    def original_menu_img(self):
+        return self.original_images["menu"]
+
+    @property
+    def original_map_img(self):
+        return self.original_images["map"]
+
+    @property
+    def original_score_board_img(self):
+        return self.original_images["score_board"]
+
+    @property
+    def original_student_walk_frames(self):
+        return [self.original_images[f"walk{i}"] for i in range(1, 4)]
+
+    @property
+    def original_shawarma_img(self):
+        return self.original_images["shawarma"]
+
+    @property
+    def original_lemon_img(self):
+        return self.original_images["lemon"]
+
+    @property
+    def original_trash_imgs(self):
+        return [self.original_images[f"trash{i}"] for i in range(1, 5)]
+
+    def current_display_format(self):
+        surface = pygame.display.get_surface()
+        return surface.get_bitsize(), surface.get_masks()
+
+    def convert_image(self, name, surface):
+        if name in self.OPAQUE_IMAGES:
+            return surface.convert()
+        return surface.convert_alpha()
+
+    def convert_assets(self):
+        display_format = self.current_display_format()
+        if display_format == self.display_format:
+            return False
+        self.display_format = display_format
+
+        for name, surface in self.original_images.items():
+            self.original_images[name] = self.convert_image(name, surface)
+        self.assets.clear()
+        return True
+
+    def prepare_sprite(self, surface):
+        if self.USE_RLE:
+            surface.set_alpha(255, pygame.RLEACCEL)
+        return surface
 
-        self.original_shawarma_img = pygame.image.load(os.path.join(self.ASSETS_PATH, "powerups", "shawarma.png"))
-        self.original_lemon_img = pygame.image.load(os.path.join(self.ASSETS_PATH, "powerups", "lemon.png"))
+    def scaled(self, name, original, size):
+        return self.assets.get((name, size), lambda: pygame.transform.scale(original, size))
 
-        self.shawarma_img = pygame.transform.scale(
-            self.original_shawarma_img, 
-            (int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y))
+    def scaled_sprite(self, name, original, size):
+        return self.assets.get(
+            (name, size),
+            lambda: self.prepare_sprite(pygame.transform.scale(original, size))
         )
-        self.lemon_img = pygame.transform.scale(
-            self.original_lemon_img, 
-            (int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y))
+
+    def scaled_font(self, base_size):
+        size = max(1, int(base_size * self.scale_y))
+        return self.assets.get(("font", size), lambda: pygame.font.Font(io.BytesIO(self.font_data), size))
+
+    def glyph_atlas(self, base_size, color):
+        size = max(1, int(base_size * self.scale_y))
+        return self.assets.get(("atlas", size, color), lambda: GlyphAtlas(self.scaled_font(base_size), color))
+
+    def cached_text(self, text, base_size, color):
+        size = max(1, int(base_size * self.scale_y))
+        return self.assets.get(
+            ("text", size, text, color),
+            lambda: self.scaled_font(base_size).render(text, True, color)
         )
 
-        self.original_trash_imgs = [
-            pygame.image.load(os.path.join(self.ASSETS_PATH, "trash", f"trash{i}.png"))
-            for i in range(1, 5)
-        ]
+    def pickup_img_size(self):
+        return (int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y))
 
-        self.trash_imgs = [
-            pygame.transform.scale(img, (int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y)))
-            for img in self.original_trash_imgs
-        ]
-    
-    def rescale_assets(self):
-        self.scale_x = self.WIDTH / self.BASE_WIDTH
-        self.scale_y = self.HEIGHT / self.BASE_HEIGHT
+    @property
+    def menu_img(self):
+        return self.scaled("menu", self.original_menu_img, (self.WIDTH, self.HEIGHT))
 
-        self.menu_img = pygame.transform.scale(self.original_menu_img, (self.WIDTH, self.HEIGHT))
-        self.map_img = pygame.transform.scale(self.original_map_img, (self.WIDTH, self.HEIGHT))
+    @property
+    def map_img(self):
+        return self.scaled("map", self.original_map_img, (self.WIDTH, self.HEIGHT))
 
+    @property
+    def score_board_img(self):
+        return self.scaled_sprite("score_board", self.original_score_board_img, self.score_board_size())
+
+    def score_board_size(self):
         orig_sb_width = self.original_score_board_img.get_width()
         orig_sb_height = self.original_score_board_img.get_height()
         sb_aspect_ratio = orig_sb_width / orig_sb_height
 
         scaled_sb_height = int(self.HEIGHT * 0.7)
         scaled_sb_width = int(scaled_sb_height * sb_aspect_ratio)
-        
-        self.score_board_img = pygame.transform.scale(
-            self.original_score_board_img, 
-            (scaled_sb_width, scaled_sb_height)
-        )
+        return (scaled_sb_width, scaled_sb_height)
 
-        font_size_factor = self.scale_y
-        font_path = os.path.join('assets', 'fonts', 'PressStart2P-Regular.ttf')
-        self.font = pygame.font.Font(font_path, int(50 * font_size_factor))
-        self.small_font = pygame.font.Font(font_path, int(24 * font_size_factor))
+    def score_board_rect(self):
+        score_board_rect = pygame.Rect((0, 0), self.score_board_size())
 
-        self.student_walk_frames = [
-            pygame.transform.scale(frame, (int(self.PLAYER_SIZE * self.scale_x), int(self.PLAYER_SIZE * self.scale_y)))
-            for frame in self.original_student_walk_frames
-        ]
+        vertical_offset = 40
+        score_board_rect.center = (self.WIDTH // 2, self.HEIGHT // 2 + vertical_offset)
+        return score_board_rect
 
-        self.shawarma_img = pygame.transform.scale(
-            self.original_shawarma_img, 
-            (int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y))
-        )
-        self.lemon_img = pygame.transform.scale(
-            self.original_lemon_img, 
-            (int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y))
-        )
+    @property
+    def font(self):
+        return self.scaled_font(50)
 
-        self.trash_imgs = [
-            pygame.transform.scale(img, (int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y)))
-            for img in self.original_trash_imgs
-        ]
+    @property
+    def sprites(self):
+        player_size = (int(self.PLAYER_SIZE * self.scale_x), int(self.PLAYER_SIZE * self.scale_y))
+        pickup_size = self.pickup_img_size()
+        return self.assets.get(("sprites", player_size, pickup_size), lambda: self.build_sprites(player_size, pickup_size))
 
-        self.exit_button_rect = pygame.Rect(
-            int(600 * self.scale_x), int(677 * self.scale_y),
-            int(390 * self.scale_x), int(80 * self.scale_y)
-        )
-        self.start_button_rect = pygame.Rect(
-            int(590 * self.scale_x), int(520 * self.scale_y),
-            int(400 * self.scale_x), int(100 * self.scale_y)
-        )
+    def build_sprites(self, player_size, pickup_size):
+        sprites = {}
+        for name in self.WALK_SPRITES:
+            sprites[name] = self.prepare_sprite(pygame.transform.scale(self.original_images[name], player_size))
+        for name in self.KIND_SPRITES.values():
+            sprites[name] = self.prepare_sprite(pygame.transform.scale(self.original_images[name], pickup_size))
+        return sprites
+    
+    @property
+    def scale_x(self):
+        return self.view.scale_x
 
-        self.create_obstacles()
+    @property
+    def scale_y(self):
+        return self.view.scale_y
+
+    def reseed(self, seed):
+        self.sim.reseed(seed)
+        self.particles.rng = np.random.default_rng(seed)
+
+    def set_quality(self, quality):
+        self.quality = quality
+        self.particles.budget = max(self.PARTICLE_BURST, int(self.PARTICLE_BUDGET * quality))
 
-        self.update_game_elements_positions()
-    
-    def update_game_elements_positions(self):
-        self.player_pos.x = int(self.player_pos.x * self.scale_x)
-        self.player_pos.y = int(self.player_pos.y * self.scale_y)
-        self.player_pos.width = int(self.PLAYER_SIZE * self.scale_x)
-        self.player_pos.height = int(self.PLAYER_SIZE * self.scale_y)
-
-        speed_scale = min(self.scale_x, self.scale_y)
-        self.DEFAULT_SPEED = int(4 * speed_scale)
-        self.BOOSTED_SPEED = int(8 * speed_scale)
-        self.player_speed = self.BOOSTED_SPEED if self.power_up_active else self.DEFAULT_SPEED
-
-        for trash in self.trash_items:
-            trash["rect"].x = int(trash["rect"].x * self.scale_x)
-            trash["rect"].y = int(trash["rect"].y * self.scale_y)
-            trash["rect"].width = int(self.PICKUP_SIZE * self.scale_x)
-            trash["rect"].height = int(self.PICKUP_SIZE * self.scale_y)
-
-        for power_up in self.power_ups:
-            power_up["rect"].x = int(power_up["rect"].x * self.scale_x)
-            power_up["rect"].y = int(power_up["rect"].y * self.scale_y)
-            power_up["rect"].width = int(self.PICKUP_SIZE * self.scale_x)
-            power_up["rect"].height = int(self.PICKUP_SIZE * self.scale_y)
-    
-    def init_game_elements(self):
-        self.create_obstacles()
-        self.spawn_trash_items()
-        self.spawn_power_ups()
-    
-    def create_obstacles(self):
-        obstacle_data = [
-            (730, 90, 170, 20),
-            (135, 0, 165, 20),
-            (1366, 0, 129, 20),
-            (260, 370, 40, 70),
-            (565, 380, 45, 40),
-            (260, 680, 50, 40),
-            (560, 680, 50, 35),
-            (1300, 390, 55, 30),
-            (1320, 680, 40, 40)
-        ]
-        
-        self.obstacles = [
-            pygame.Rect(
-                int(x * self.scale_x), int(y * self.scale_y), 
-                int(w * self.scale_x), int(h * self.scale_y)
-            ) for x, y, w, h in obstacle_data
-        ]
-    
-    def spawn_trash_items(self):
-        self.trash_items = []
-        for _ in range(16):
-            x = random.randint(50, self.WIDTH - 100)
-            y = random.randint(50, self.HEIGHT - 100)
-            img_index = random.randint(0, len(self.trash_imgs) - 1)
-            self.trash_items.append({
-                "rect": pygame.Rect(x, y, int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y)),
-                "img": self.trash_imgs[img_index]
-            })
-    
-    def spawn_power_ups(self):
-        self.power_ups = []
-        for _ in range(3):
-            x = random.randint(50, self.WIDTH - 100)
-            y = random.randint(50, self.HEIGHT - 100)
-            img = random.choice([self.shawarma_img, self.lemon_img])
-            self.power_ups.append({
-                "rect": pygame.Rect(x, y, int(self.PICKUP_SIZE * self.scale_x), int(self.PICKUP_SIZE * self.scale_y)),
-                "img": img
-            })
-    
     def spawn_particles(self, x, y, color=(255, 255, 0)):
-        for _ in range(15):
-            self.particles.append(Particle(x / self.scale_x, y / self.scale_y, color))
+        self.particles.spawn(x, y, color, self.get_ticks(), max(1, round(self.PARTICLE_BURST * self.quality)))
     
     def update_particles(self):
-        for particle in self.particles[:]:
-            particle.update()
-            if not particle.is_alive():
-                self.particles.remove(particle)
+        self.particles.update(self.get_ticks())
     
     def start_flash(self):
         self.flash_alpha = 255
-        self.flash_start_time = pygame.time.get_ticks()
-    
-    def fade_out_menu(self, duration=500):
-        fade_surface = pygame.Surface((self.WIDTH, self.HEIGHT))
-        fade_surface.fill((0, 0, 0))
-        
-        steps = int(duration / 16)
-        for i in range(steps):
-            alpha = int((i / steps) * 255)
-            self.screen.blit(self.menu_img, (0, 0))
-            fade_surface.set_alpha(alpha)
-            self.screen.blit(fade_surface, (0, 0))
-            pygame.display.update()
-            pygame.time.delay(16)
-            
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-    
-    def fade_in_from_black(self, duration=500):
-        fade_surface = pygame.Surface((self.WIDTH, self.HEIGHT))
-        fade_surface.fill((0, 0, 0))
-        
-        steps = int(duration / 16)
-        for i in range(steps):
-            alpha = 255 - int((i / steps) * 255)
-            self.screen.blit(self.map_img, (0, 0))
-            fade_surface.set_alpha(alpha)
-            self.screen.blit(fade_surface, (0, 0))
-            pygame.display.update()
-            pygame.time.delay(16)
-    
-    def play_intro_video(self, video_path, audio_path):
-        pygame.mixer.music.load(audio_path)
-        pygame.mixer.music.play()
-        
-        cap = cv2.VideoCapture(video_path)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        video_duration = total_frames / fps
-        start_time = time.time()
-        
-        skip = False
-        
-        while cap.isOpened() and not skip:
-            elapsed_time = time.time() - start_time
-            if elapsed_time >= video_duration:
-                break
-            
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = cv2.resize(frame, (self.WIDTH, self.HEIGHT))
-            frame_surface = pygame.surfarray.make_surface(frame.swapaxes(0, 1))
-            
-            self.screen.blit(frame_surface, (0, 0))
-            skip_text = self.small_font.render("Press ESC to skip...", True, (255, 165, 0))
-            self.screen.blit(skip_text, (20, 20))
-            pygame.display.update()
-            pygame.time.delay(int(1000 / fps))
-            
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    cap.release()
-                    pygame.mixer.music.stop()
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        skip = True
-                elif event.type == pygame.VIDEORESIZE:
-                    self.handle_resize(event.size)
-        
-        cap.release()
-        pygame.mixer.music.stop()
+        self.flash_start_time = self.get_ticks()
+        self.full_redraw = True
+
+    def update_flash(self):
+        if self.flash_alpha > 0 and self.get_ticks() - self.flash_start_time > self.FLASH_DURATION:
+            self.flash_alpha = max(0, self.flash_alpha - 25)
     
-    def handle_resize(self, size):
-        old_width, old_height = self.WIDTH, self.HEIGHT
-        self.WIDTH, self.HEIGHT = size
+    def open_intro(self, video_path):
+        baked_path = BakedIntroPlayer.path_for(self.INTRO_CACHE_PATH, (self.WIDTH, self.HEIGHT))
+        if os.path.exists(baked_path):
+            try:
+                return BakedIntroPlayer(baked_path)
+            except ValueError:
+                pass
+        return IntroPlayer(video_path, (self.WIDTH, self.HEIGHT))
 
-        self.scale_x = self.WIDTH / self.BASE_WIDTH
-        self.scale_y = self.HEIGHT / self.BASE_HEIGHT
+    def queue_resize(self, size):
+        self.pending_size = size
+        self.last_resize_event = pygame.time.get_ticks()
 
-        self.rescale_assets()
+    def apply_pending_resize(self):
+        if self.pending_size is None:
+            return
+        if pygame.time.get_ticks() - self.last_resize_event < self.RESIZE_SETTLE_MS:
+            return
+        size, self.pending_size = self.pending_size, None
+        if size != (self.WIDTH, self.HEIGHT):
+            self.handle_resize(size)
 
-        if self.game_running:
-            ratio_x = self.WIDTH / old_width
-            ratio_y = self.HEIGHT / old_height
-            self.player_pos.x = int(self.player_pos.x * ratio_x)
-            self.player_pos.y = int(self.player_pos.y * ratio_y)
+    def handle_resize(self, size):
+        self.WIDTH, self.HEIGHT = size
+        self.view.resize(size)
+        self.convert_assets()
+        if self.assets_ready:
+            self.layout_ui()
+        self.full_redraw = True
     
     def play_background_music(self):
-        pygame.mixer.music.load(os.path.join(self.ASSETS_PATH, "background_music.mp3"))
-        pygame.mixer.music.set_volume(0.5)
-        pygame.mixer.music.play(loops=-1)
+        self.audio.play_music("background_music", loops=-1, fade_ms=self.MUSIC_FADE_MS, volume=0.5)
     
     def reset_game(self):
-        self.score = 0
+        if self.recorder:
+            self.recorder.reset(self.get_ticks())
+        self.end_session()
+        self.full_redraw = True
         self.game_running = True
-        self.start_time = time.time()
-        self.end_time = None
-        self.elapsed_time = 0
-        self.spawn_trash_items()
-        self.spawn_power_ups()
-        self.power_up_active = False
-        self.player_speed = int(self.DEFAULT_SPEED * min(self.scale_x, self.scale_y))
-        self.player_pos = pygame.Rect(
-            int(100 * self.scale_x), int(100 * self.scale_y), 
-            int(self.PLAYER_SIZE * self.scale_x), int(self.PLAYER_SIZE * self.scale_y)
-        )
-        pygame.time.delay(200)
-    
-    def handle_player_movement(self):
-        if self.score >= 16:
-            return False
-            
-        keys = pygame.key.get_pressed()
-        moving = False
-        old_pos = self.player_pos.copy()
-        
-        if keys[pygame.K_LEFT]:
-            self.player_pos.x -= self.player_speed
-            moving = True
-        if keys[pygame.K_RIGHT]:
-            self.player_pos.x += self.player_speed
-            moving = True
-        if keys[pygame.K_UP]:
-            self.player_pos.y -= self.player_speed
-            moving = True
-        if keys[pygame.K_DOWN]:
-            self.player_pos.y += self.player_speed
-            moving = True
-        
-        self.player_pos.clamp_ip(pygame.Rect(0, 0, self.WIDTH, self.HEIGHT))
+        self.sim.reset(self.get_ticks())
+        self.session_logged = False
+        self.session_frames = []
 
-        for obstacle in self.obstacles:
-            if self.player_pos.colliderect(obstacle):
-                self.player_pos = old_pos
-                break
-        
-        return moving
-    
-    def update_animation(self, moving, dt):
-        if moving:
-            self.animation_timer += dt
-            if self.animation_timer >= self.ANIMATION_DELAY:
-                self.animation_index = (self.animation_index + 1) % len(self.student_walk_frames)
-                self.animation_timer = 0
-        else:
-            self.animation_index = 1
+    def end_session(self):
+        if self.session_logged:
+            return
+        self.session_logged = True
+        if not self.telemetry:
+            return
+        sim = self.sim
+        frames = np.array(self.session_frames or [0], np.float32)
+        p50, p95 = np.percentile(frames, (50, 95)).tolist()
+        record = (time.time(), sim.seed, int(sim.elapsed_seconds(self.get_ticks()) * 1000),
+                  sim.score + sim.power_ups_used, sim.power_ups_used, int(sim.finished),
+                  len(self.session_frames), p50, p95, float(frames.max()))
+        if self.telemetry.submit(record):
+            self.leaderboard.offer(record)
     
-    def handle_collisions(self):
-        for trash in self.trash_items[:]:
-            if self.player_pos.colliderect(trash["rect"]):
-                self.spawn_particles(trash["rect"].centerx, trash["rect"].centery, (255, 255, 0))
-                self.trash_items.remove(trash)
-                self.score += 1
-                self.broom_sweep_sound.play()
-
-        for power_up in self.power_ups[:]:
-            if self.player_pos.colliderect(power_up["rect"]):
-                color = (144, 238, 144) if power_up["img"] == self.shawarma_img else (255, 165, 0)
-                self.spawn_particles(power_up["rect"].centerx, power_up["rect"].centery, color)
-                self.power_ups.remove(power_up)
-                self.power_up_active = True
+    def start_recording(self, path):
+        self.recorder = InputRecorder(path, self.sim.seed, self.level)
+
+    def stop_recording(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def handle_collected(self):
+        for entity in self.sim.collected:
+            rect = entity.rect
+            self.removed_rects.append(self.view.to_screen_rect(rect))
+            if entity.kind in self.POWER_UP_COLORS:
+                self.spawn_particles(rect.centerx, rect.centery, self.POWER_UP_COLORS[entity.kind])
                 self.start_flash()
-                self.power_up_timer = pygame.time.get_ticks()
-                self.player_speed = int(self.BOOSTED_SPEED * min(self.scale_x, self.scale_y))
-                self.pickup_sound.play()
+                self.audio.play("pickup", self.get_ticks())
+            else:
+                self.spawn_particles(rect.centerx, rect.centery, (255, 255, 0))
+                self.audio.play("broom_sweep", self.get_ticks())
+        self.sim.collected.clear()
 
-        if self.score == 16 and self.end_time is None:
-            self.end_time = time.time()
-            self.elapsed_time = self.end_time - self.start_time
-    
-    def update_power_up_status(self):
-        if self.power_up_active and pygame.time.get_ticks() - self.power_up_timer > self.BOOST_DURATION:
-            self.power_up_active = False
-            self.player_speed = int(self.DEFAULT_SPEED * min(self.scale_x, self.scale_y))
-    
     def draw_menu_screen(self):
         self.screen.blit(self.menu_img, (0, 0))
-    
-    def draw_game_screen(self):
-        self.screen.blit(self.map_img, (0, 0))
+        if not self.assets_ready:
+            self.draw_loading_bar(self.loader.progress())
 
-        self.screen.blit(self.student_walk_frames[self.animation_index], 
-                        (self.player_pos.x, self.player_pos.y))
+    def draw_loading_bar(self, progress):
+        bar = pygame.Rect(0, 0, int(self.WIDTH * 0.4), max(4, int(16 * self.scale_y)))
+        bar.center = (self.WIDTH // 2, self.HEIGHT - int(60 * self.scale_y))
+        fill = bar.copy()
+        fill.width = int(bar.width * progress)
+        pygame.draw.rect(self.screen, (255, 165, 0), fill)
+        pygame.draw.rect(self.screen, (255, 255, 255), bar, 2)
+    
+    def timer_text(self):
+        return f"Time: {self.sim.elapsed_seconds(self.get_ticks()):.2f}s"
 
-        for trash in self.trash_items:
-            self.screen.blit(trash["img"], (trash["rect"].x, trash["rect"].y))
+    def draw_game_screen(self, time_text=None):
+        self.screen.blit(self.map_img, (0, 0))
 
-        for power_up in self.power_ups:
-            self.screen.blit(power_up["img"], (power_up["rect"].x, power_up["rect"].y))
+        self.screen.blits(self.sprite_blits(self.sim.trash_items, self.sim.power_ups), False)
 
-        if self.start_time and self.end_time is None:
-            self.elapsed_time = time.time() - self.start_time
-        
-        time_display = self.font.render(f"Time: {self.elapsed_time:.2f}s", True, (255, 165, 0))
-        self.screen.blit(time_display, (30, 30))
+        if time_text is None:
+            time_text = self.timer_text()
+        self.glyph_atlas(50, (255, 165, 0)).draw(self.screen, time_text, (30, 30))
 
         self.draw_flash_effect()
 
-        if self.score == 16:
+        if self.sim.finished:
             self.draw_score_board()
     
+    def sprite_blits(self, trash_items, power_ups, player=True):
+        sprites = self.sprites
+        kind_sprites = self.KIND_SPRITES
+        to_screen = self.view.to_screen
+        blits = []
+        if player:
+            blits.append((sprites[self.WALK_SPRITES[self.sim.animation_index]], self.view.to_screen_rect(self.player_rect())))
+        for entity in itertools.chain(trash_items, power_ups):
+            blits.append((sprites[kind_sprites[entity.kind]], to_screen(entity.rect.topleft)))
+        return blits
+
     def draw_flash_effect(self):
         if self.flash_alpha > 0:
-            flash_surface = pygame.Surface((self.WIDTH, self.HEIGHT))
-            flash_surface.fill((255, 255, 255))
-            flash_surface.set_alpha(self.flash_alpha)
+            flash_surface = self.overlays.get((self.WIDTH, self.HEIGHT), (255, 255, 255), self.flash_alpha)
             self.screen.blit(flash_surface, (0, 0))
-
-            if pygame.time.get_ticks() - self.flash_start_time > self.FLASH_DURATION:
-                self.flash_alpha = max(0, self.flash_alpha - 25)
+            self.full_redraw = True
     
     def draw_score_board(self):
-        score_board_rect = self.score_board_img.get_rect()
-
-        vertical_offset = 40
-        score_board_rect.center = (self.WIDTH // 2, self.HEIGHT // 2 + vertical_offset)
-
+        score_board_rect = self.score_board_rect()
         self.screen.blit(self.score_board_img, score_board_rect)
 
-        trash_collected_text = self.font.render(f"{self.score}/16", True, (255, 165, 0))
+        trash_collected_text = f"{self.sim.score}/{self.level.trash_count}"
+        atlas = self.glyph_atlas(50, (255, 165, 0))
         vertical_text_offset = 40
-        text_rect = trash_collected_text.get_rect(center=(score_board_rect.centerx, score_board_rect.centery + vertical_text_offset))
-        self.screen.blit(trash_collected_text, text_rect)
+        text_rect = atlas.get_rect(trash_collected_text, center=(score_board_rect.centerx, score_board_rect.centery + vertical_text_offset))
+        atlas.draw(self.screen, trash_collected_text, text_rect.topleft)
+
+        if self.leaderboard:
+            self.draw_leaderboard(text_rect.bottom + 10, score_board_rect.centerx)
+
+    def draw_leaderboard(self, top, centerx):
+        atlas = self.glyph_atlas(20, (200, 70, 0))
+        for rank, elapsed_ms in enumerate(self.leaderboard.top(self.LEADERBOARD_SIZE)["elapsed_ms"].tolist(), 1):
+            line = f"{rank}. {elapsed_ms / 1000:.2f}s"
+            atlas.draw(self.screen, line, atlas.get_rect(line, midtop=(centerx, top)).topleft)
+            top += atlas.height
 
+    def layout_ui(self):
+        self.ui.place("start", self.view.to_screen_rect(self.start_button_rect))
+        self.ui.place("exit", self.view.to_screen_rect(self.exit_button_rect))
+
+        score_board_rect = self.score_board_rect()
         sb_width_scale = score_board_rect.width / self.original_score_board_img.get_width()
         sb_height_scale = score_board_rect.height / self.original_score_board_img.get_height()
         
@@ -523,86 +2238,970 @@ class Game:
         try_again_width = int((self.try_again_offsets['x2'] - self.try_again_offsets['x1']) * sb_width_scale)
         try_again_height = int((self.try_again_offsets['y2'] - self.try_again_offsets['y1']) * sb_height_scale)
         
-        try_again_button_rect = pygame.Rect(try_again_x, try_again_y, try_again_width, try_again_height)
+        self.ui.place("try_again", pygame.Rect(try_again_x, try_again_y, try_again_width, try_again_height))
+
+    def ui_screen(self):
+        if self.transition:
+            return None
+        if not self.game_running:
+            return "menu"
+        if self.sim.finished:
+            return "score_board"
+        return None
+
+    def sync_ui(self):
+        screen = self.ui_screen()
+        if screen != self.ui.screen:
+            self.ui.set_screen(screen, pygame.mouse.get_pos())
+
+    def click_start(self):
+        self.poll_assets(wait=True)
+        self.start_game()
+
+    def click_exit(self):
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
 
-        mouse_pos = pygame.mouse.get_pos()
-        if try_again_button_rect.collidepoint(mouse_pos):
-            pygame.mouse.set_cursor(self.hand_cursor)
-            if pygame.mouse.get_pressed()[0]:
-                self.reset_game()
-        else:
-            if not self.exit_button_rect.collidepoint(mouse_pos) and not self.start_button_rect.collidepoint(mouse_pos):
-                pygame.mouse.set_cursor(self.default_cursor)
-    
-    def handle_cursor(self):
-        mouse_pos = pygame.mouse.get_pos()
-        if self.exit_button_rect.collidepoint(mouse_pos) or self.start_button_rect.collidepoint(mouse_pos):
-            pygame.mouse.set_cursor(self.hand_cursor)
-        else:
-            pygame.mouse.set_cursor(self.default_cursor)
-    
     def start_game(self):
-        self.fade_out_menu()
         video_path = os.path.join(self.ASSETS_PATH, "intro.mp4")
-        audio_path = os.path.join(self.ASSETS_PATH, "intro_audio.mp3")
-        self.play_intro_video(video_path, audio_path)
-        self.fade_in_from_black()
+        self.play_transitions([
+            Fade("menu_img", 0, 255),
+            IntroTransition(video_path, "intro_audio"),
+            Fade("map_img", 255, 0),
+        ], self.begin_play)
+
+    def begin_play(self):
         self.play_background_music()
         self.reset_game()
+
+    def play_transitions(self, steps, on_complete=None):
+        self.transitions = deque(steps)
+        self.on_transitions_done = on_complete
+        self.next_transition()
+
+    def next_transition(self):
+        if self.transitions:
+            self.transition = self.transitions.popleft()
+            self.transition.start(self)
+            return
+        self.transition = None
+        on_complete, self.on_transitions_done = self.on_transitions_done, None
+        if on_complete:
+            on_complete()
+
+    def update_transition(self):
+        if self.transition and self.transition.update(self):
+            self.transition.finish(self)
+            self.next_transition()
+
+    def cancel_transitions(self):
+        if self.transition:
+            self.transition.finish(self)
+        self.transition = None
+        self.transitions.clear()
+        self.on_transitions_done = None
     
     def process_events(self):
+        self.sync_ui()
         for event in pygame.event.get():
+            if self.recorder and event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                self.recorder.mouse(event.type == pygame.MOUSEBUTTONDOWN, event.button, self.view.to_world(event.pos))
             if event.type == pygame.QUIT:
                 return False
             elif event.type == pygame.VIDEORESIZE:
-                self.handle_resize(event.size)
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if not self.game_running:
-                    mouse_pos = pygame.mouse.get_pos()
-                    if self.exit_button_rect.collidepoint(mouse_pos):
-                        pygame.quit()
-                        sys.exit()
-                    if self.start_button_rect.collidepoint(mouse_pos):
-                        self.start_game()
+                if not self.scaled_display:
+                    self.queue_resize(event.size)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and self.profiler:
+                self.toggle_profiler_overlay()
+            elif self.transition:
+                self.transition.handle_event(self, event)
+            elif self.ui.handle_event(event):
+                self.sync_ui()
+        self.apply_pending_resize()
         return True
     
     def update(self, dt):
         if self.game_running:
-            moving = self.handle_player_movement()
-            self.update_animation(moving, dt)
-            self.handle_collisions()
-            self.update_power_up_status()
+            self.sim.step(self.get_pressed_keys(), dt, self.get_ticks())
+            self.handle_collected()
+            if self.sim.finished:
+                self.end_session()
     
     def render(self):
-        self.screen.fill((0, 0, 0))
-        
-        if not self.game_running:
+        start = time.perf_counter()
+
+        if self.transition:
+            self.transition.draw(self)
+            self.present()
+            self.full_redraw = True
+            blit_bytes = self.WIDTH * self.HEIGHT * self.screen.get_bytesize()
+        elif not self.game_running:
+            self.screen.fill((0, 0, 0))
             self.draw_menu_screen()
+            self.present()
+            self.full_redraw = True
+            blit_bytes = self.WIDTH * self.HEIGHT * self.screen.get_bytesize()
         else:
-            self.draw_game_screen()
+            blit_bytes = self.render_game()
 
-            for particle in self.particles:
-                particle.draw(self.screen, (self.scale_x, self.scale_y))
-        
-        pygame.display.flip()
+        if "first_frame_ms" not in self.startup_stats:
+            self.startup_stats["first_frame_ms"] = (time.perf_counter() - IMPORT_START) * 1000
+
+        stats = self.render_stats
+        stats["frames"] += 1
+        stats["last_blit_bytes"] = blit_bytes
+        stats["blit_bytes"] += blit_bytes
+        stats["render_ms"] += (time.perf_counter() - start) * 1000
+
+    def player_rect(self):
+        rect = self.sim.player.rect
+        if self.render_alpha >= 1:
+            return rect
+        x, y = self.sim.player_previous
+        lag = 1 - self.render_alpha
+        return rect.move(round((x - rect.x) * lag), round((y - rect.y) * lag))
+
+    def frame_rects(self, time_text):
+        rects = [self.view.to_screen_rect(self.player_rect()), self.glyph_atlas(50, (255, 165, 0)).get_rect(time_text, topleft=(30, 30))]
+        particle_bounds = self.particles.bounds(self.view.scale)
+        if particle_bounds:
+            rects.append(particle_bounds)
+        if self.profiler and self.profiler.show_overlay:
+            rects.append(self.profiler_overlay_rect())
+        return rects
+
+    def merge_rects(self, rects):
+        screen_rect = self.screen.get_rect()
+        merged = []
+        for rect in rects:
+            rect = rect.clip(screen_rect)
+            if not rect.width or not rect.height:
+                continue
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect = rect.union(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def present(self, dirty=None):
+        if self.profiler and self.profiler.show_overlay:
+            self.draw_profiler_overlay()
+        if dirty is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+
+    def enable_profiler(self, trace=False):
+        self.profiler = Profiler(trace)
+        self.profiler.instrument(self, self.PROFILED_SECTIONS)
+        self.profiler.instrument(self.particles, ("draw",), "particles.")
+
+    def toggle_profiler_overlay(self):
+        self.profiler.show_overlay = not self.profiler.show_overlay
+        self.profiler.lines = self.profiler.format_lines()
+        self.full_redraw = True
+
+    def profiler_overlay_rect(self):
+        atlas = self.glyph_atlas(self.PROFILER_FONT_SIZE, (255, 255, 255))
+        lines = self.profiler.lines
+        width = max(atlas.size(line)[0] for line in lines) + 20
+        rect = pygame.Rect(0, 0, width, atlas.height * len(lines) + 20)
+        rect.topright = (self.WIDTH - 10, 10)
+        return rect
+
+    def draw_profiler_overlay(self):
+        atlas = self.glyph_atlas(self.PROFILER_FONT_SIZE, (255, 255, 255))
+        rect = self.profiler_overlay_rect()
+        self.screen.fill((0, 0, 0), rect)
+        for index, line in enumerate(self.profiler.lines):
+            atlas.draw(self.screen, line, (rect.left + 10, rect.top + 10 + index * atlas.height))
+
+    def render_game(self):
+        time_text = self.timer_text()
+        current_rects = self.frame_rects(time_text)
+
+        if not self.dirty_rendering or self.full_redraw or self.sim.finished:
+            self.full_redraw = False
+            self.screen.fill((0, 0, 0))
+            self.draw_game_screen(time_text)
+            self.particles.draw(self.screen, self.view.scale)
+            self.present()
+            self.render_stats["full_frames"] += 1
+            self.previous_rects = current_rects
+            self.removed_rects = []
+            return self.WIDTH * self.HEIGHT * self.screen.get_bytesize()
+
+        dirty = self.merge_rects(self.previous_rects + current_rects + self.removed_rects)
+        self.previous_rects = current_rects
+        self.removed_rects = []
+
+        map_img = self.map_img
+        timer_atlas = self.glyph_atlas(50, (255, 165, 0))
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.screen.blit(map_img, rect, rect)
+            base_rect = self.view.to_world_rect(rect)
+            self.screen.blits(self.sprite_blits(
+                self.sim.trash_items.query(base_rect, ordered=True),
+                self.sim.power_ups.query(base_rect, ordered=True),
+                self.player_rect().colliderect(base_rect)
+            ), False)
+            timer_atlas.draw(self.screen, time_text, (30, 30))
+        self.screen.set_clip(None)
+
+        self.particles.draw(self.screen, self.view.scale)
+        self.present(dirty)
+        return sum(rect.width * rect.height for rect in dirty) * self.screen.get_bytesize()
     
     def run(self):
         running = True
         while running:
-            dt = self.clock.tick(60)
-            self.update_particles()
-            
-            running = self.process_events()
+            steps = self.pacer.tick()
+            if self.pacer.quality != self.quality:
+                self.set_quality(self.pacer.quality)
+            self.poll_assets()
+            self.audio.update()
 
-            if not self.game_running or self.score < 16:
-                self.handle_cursor()
+            running = self.process_events()
 
-            self.update(dt)
+            self.update_transition()
+            for _ in range(steps):
+                self.sim_ticks += self.FIXED_DT
+                if self.recorder and self.game_running:
+                    self.recorder.tick(self.get_pressed_keys(), self.FIXED_DT, self.get_ticks())
+                self.fixed_update()
 
+            self.render_alpha = self.pacer.alpha
             self.render()
+            if self.game_running and not self.session_logged:
+                self.session_frames.append(self.pacer.last_work_ms)
+            if self.profiler:
+                self.profiler.end_frame()
         
+        self.cancel_transitions()
+        self.close_telemetry()
+        pygame.quit()
+
+    def close_telemetry(self):
+        if self.telemetry:
+            self.end_session()
+            self.telemetry.close()
+            self.telemetry = None
+
+    def step(self):
+        self.sim_ticks += self.FIXED_DT
+        self.fixed_update()
+
+    def fixed_update(self):
+        self.update_particles()
+        self.update_flash()
+        self.update(self.FIXED_DT)
+
+    def run_headless(self, ticks, script=None):
+        for _ in range(ticks):
+            if script is not None:
+                self.input_keys = script.next_keys()
+            self.step()
+            if self.sim.finished:
+                return True
+        return False
+
+BENCH_SUBSYSTEMS = (
+    "update_particles",
+    "handle_player_movement",
+    "update_animation",
+    "handle_collisions",
+    "update_power_up_status",
+)
+
+def timed(func, totals, name):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        totals[name] += time.perf_counter() - start
+        return result
+    return wrapper
+
+def instrument_subsystems(game):
+    totals = dict.fromkeys(BENCH_SUBSYSTEMS, 0.0)
+    for name in BENCH_SUBSYSTEMS:
+        owner = game if hasattr(game, name) else game.sim
+        setattr(owner, name, timed(getattr(owner, name), totals, name))
+    return totals
+
+def benchmark(sessions=10, ticks=3600, seed=0, level_path=None):
+    game = Game(headless=True, level=level_path)
+    totals = instrument_subsystems(game)
+
+    total_ticks = 0
+    cleared = 0
+    start = time.perf_counter()
+    for session in range(sessions):
+        game.reseed(seed + session)
+        game.sim_ticks = 0
+        game.particles.clear()
+        game.reset_game()
+        script = ScriptedInput(seed + session)
+        before = game.sim_ticks
+        cleared += game.run_headless(ticks, script)
+        total_ticks += round((game.sim_ticks - before) / game.FIXED_DT)
+    wall = time.perf_counter() - start
+    game.input_keys = None
+
+    return {
+        "sessions": sessions,
+        "cleared": cleared,
+        "ticks": total_ticks,
+        "seconds": wall,
+        "ticks_per_sec": total_ticks / wall if wall else 0.0,
+        "subsystems": totals,
+    }
+
+def print_benchmark(result):
+    print(f"sessions: {result['sessions']} (cleared {result['cleared']})")
+    print(f"ticks:    {result['ticks']} in {result['seconds']:.3f}s")
+    print(f"ticks/s:  {result['ticks_per_sec']:.0f}")
+    for name, seconds in result["subsystems"].items():
+        per_tick = seconds / result["ticks"] * 1e6 if result["ticks"] else 0.0
+        print(f"  {name:<24} {seconds * 1000:9.2f} ms  {per_tick:8.2f} us/tick")
+
+def replay(path, expected=None):
+    log = InputLog(path)
+    try:
+        game = Game(headless=True, seed=log.seed, level=log.level_path)
+    except OSError as error:
+        raise ValueError(f"{path} was recorded on {log.level_path}, which cannot be loaded: {error}") from error
+    if game.level.digest != log.level_digest:
+        raise ValueError(f"{path} was recorded on a different version of {log.level_path}")
+    totals = instrument_subsystems(game)
+    key_states = InputLog.key_states()
+
+    hashes = []
+    sessions = 0
+    cleared = 0
+    mouse_events = 0
+    clicks = []
+    diverged = None
+    start = time.perf_counter()
+    for kind, value, dt, now in log:
+        if kind == InputLog.TICK:
+            game.sim_ticks = now
+            game.input_keys = key_states[value]
+            game.fixed_update()
+            state = game.sim.state_hash()
+            if expected is not None and diverged is None and (len(hashes) >= len(expected) or expected[len(hashes)] != state):
+                diverged = len(hashes)
+            hashes.append(state)
+        elif kind == InputLog.RESET:
+            cleared += game.sim.finished
+            game.sim_ticks = now
+            game.reset_game()
+            sessions += 1
+        else:
+            mouse_events += 1
+            if kind == InputLog.MOUSE_DOWN:
+                clicks.append((len(hashes), value, InputLog.mouse_pos(now)))
+    wall = time.perf_counter() - start
+    cleared += sessions > 0 and game.sim.finished
+    game.input_keys = None
+    if expected is not None and diverged is None and len(expected) != len(hashes):
+        diverged = len(hashes)
+
+    return {
+        "sessions": sessions,
+        "cleared": cleared,
+        "ticks": len(hashes),
+        "seconds": wall,
+        "ticks_per_sec": len(hashes) / wall if wall else 0.0,
+        "subsystems": totals,
+        "mouse_events": mouse_events,
+        "clicks": clicks,
+        "hashes": hashes,
+        "diverged": diverged,
+    }
+
+def print_replay(result):
+    print_benchmark(result)
+    print(f"mouse events: {result['mouse_events']}")
+    for tick, button, (x, y) in result["clicks"]:
+        print(f"  click button {button} at ({x}, {y}) before tick {tick}")
+    if result["hashes"]:
+        print(f"final state: {result['hashes'][-1]}")
+    if result["diverged"] is not None:
+        print(f"diverged from expected hashes at tick {result['diverged']}")
+
+def run_session_shard(seeds, ticks, level_path=None):
+    level = Simulation.load_level(level_path)
+    sims = [Simulation(level, seed) for seed in seeds]
+    scripts = [ScriptedInput(seed) for seed in seeds]
+    for sim in sims:
+        sim.reset(0)
+
+    active = list(range(len(sims)))
+    completions = []
+    steps = 0
+    start = time.process_time()
+    for tick in range(1, ticks + 1):
+        now = int(tick * Game.FIXED_DT)
+        still_active = []
+        for index in active:
+            sim = sims[index]
+            sim.step(scripts[index].next_keys(), Game.FIXED_DT, now)
+            sim.collected.clear()
+            if sim.finished:
+                completions.append(sim.elapsed_seconds(now))
+            else:
+                still_active.append(index)
+        steps += len(active)
+        active = still_active
+        if not active:
+            break
+    return {"completions": completions, "steps": steps, "cpu_seconds": time.process_time() - start}
+
+def run_sessions(sessions=1000, ticks=3600, workers=None, seed=0, level_path=None):
+    workers = max(1, min(workers or os.cpu_count() or 1, sessions))
+    seeds = list(range(seed, seed + sessions))
+    shards = [seeds[index::workers] for index in range(workers)]
+    Simulation.load_level(level_path)
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [run_session_shard(seeds, ticks, level_path)]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(run_session_shard, shards, [ticks] * workers, [level_path] * workers))
+    wall = time.perf_counter() - start
+
+    completions = np.array([seconds for result in results for seconds in result["completions"]])
+    steps = sum(result["steps"] for result in results)
+    cpu_seconds = sum(result["cpu_seconds"] for result in results)
+    return {
+        "sessions": sessions,
+        "workers": workers,
+        "cleared": len(completions),
+        "seconds": wall,
+        "steps": steps,
+        "sessions_per_sec": sessions / wall if wall else 0.0,
+        "sessions_per_core_sec": sessions / cpu_seconds if cpu_seconds else 0.0,
+        "ticks_per_sec": steps / wall if wall else 0.0,
+        "completion": {
+            "mean": float(completions.mean()) if len(completions) else None,
+            "p50": float(np.percentile(completions, 50)) if len(completions) else None,
+            "p95": float(np.percentile(completions, 95)) if len(completions) else None,
+        },
+    }
+
+def print_sessions(result):
+    print(f"sessions: {result['sessions']} on {result['workers']} workers (cleared {result['cleared']})")
+    print(f"wall:     {result['seconds']:.3f}s, {result['steps']} session ticks ({result['ticks_per_sec']:.0f}/s)")
+    print(f"sessions/s: {result['sessions_per_sec']:.1f} total, {result['sessions_per_core_sec']:.1f} per core")
+    completion = result["completion"]
+    if completion["mean"] is not None:
+        print(f"completion: mean {completion['mean']:.2f}s  p50 {completion['p50']:.2f}s  p95 {completion['p95']:.2f}s")
+
+def bench_collisions(counts=(16, 1000, 50000), frames=1000, seed=0):
+    size = Game.PICKUP_SIZE
+    step = Simulation.BOOSTED_SPEED
+    span_x = Game.BASE_WIDTH - Game.PLAYER_SIZE
+    path = []
+    x, y, direction = 0, 0, 1
+    for _ in range(frames):
+        path.append(pygame.Rect(x, y, Game.PLAYER_SIZE, Game.PLAYER_SIZE))
+        x += step * direction
+        if not 0 <= x <= span_x:
+            direction = -direction
+            x += step * direction
+            y = (y + Game.PLAYER_SIZE // 2) % (Game.BASE_HEIGHT - Game.PLAYER_SIZE)
+
+    results = []
+    for count in counts:
+        rng = random.Random(seed)
+        items = []
+        grid = SpatialGrid(Simulation.GRID_CELL_SIZE)
+        for _ in range(count):
+            x = rng.randint(50, Game.BASE_WIDTH - 100)
+            y = rng.randint(50, Game.BASE_HEIGHT - 100)
+            item = Entity(Kind.TRASH1, pygame.Rect(x, y, size, size))
+            items.append(item)
+            grid.insert(item, item.rect)
+
+        collected = 0
+        start = time.perf_counter()
+        for player in path:
+            for item in items[:]:
+                if player.colliderect(item.rect):
+                    items.remove(item)
+                    collected += 1
+        scan = (time.perf_counter() - start) / frames
+
+        start = time.perf_counter()
+        for player in path:
+            for item in grid.query(player):
+                grid.remove(item)
+        indexed = (time.perf_counter() - start) / frames
+
+        results.append((count, collected, scan, indexed))
+    return results
+
+def print_bench_collisions(results):
+    print(f"{'items':>7} {'collected':>10} {'scan/frame':>12} {'grid/frame':>12} {'speedup':>8}")
+    for count, collected, scan, indexed in results:
+        print(f"{count:>7} {collected:>10} {scan * 1e6:>9.2f} us {indexed * 1e6:>9.2f} us {scan / indexed:>7.1f}x")
+
+def bench_movement(counts=(9, 1000, 10000), moves=5000, seed=0):
+    level = Simulation.load_level()
+    results = []
+    for count in counts:
+        rng = random.Random(seed)
+        obstacles = [pygame.Rect(rect) for rect in level.obstacle_rects.tolist()]
+        start_rect = pygame.Rect(100, 100, Simulation.PLAYER_SIZE, Simulation.PLAYER_SIZE)
+        while len(obstacles) < count:
+            rect = pygame.Rect(rng.randint(0, Simulation.BASE_WIDTH - 8), rng.randint(0, Simulation.BASE_HEIGHT - 8),
+                               rng.choice((4, 8)), rng.choice((4, 8)))
+            if not rect.colliderect(start_rect):
+                obstacles.append(rect)
+
+        timings = []
+        for cell_size in (Simulation.GRID_CELL_SIZE, 1 << 20):
+            sim = Simulation(level, seed)
+            sim.obstacles = SpatialGrid(cell_size)
+            for rect in obstacles:
+                obstacle = Entity(Kind.OBSTACLE, rect)
+                sim.obstacles.insert(obstacle, rect)
+            sim.player_speed = Simulation.BOOSTED_SPEED
+            script = ScriptedInput(seed, 5, 30)
+            keys = [script.next_keys() for _ in range(moves)]
+            start = time.perf_counter()
+            for pressed in keys:
+                sim.handle_player_movement(pressed)
+            timings.append((time.perf_counter() - start) / moves)
+
+        sim = Simulation(level, seed)
+        sim.player_speed = 300
+        wall = sim.obstacles.query(pygame.Rect(260, 370, 40, 70))[0].rect
+        sim.player.rect.midright = (wall.left - 10, wall.centery)
+        sim.handle_player_movement(KeyState((pygame.K_RIGHT,)))
+        tunneled = sim.player.rect.left >= wall.right
+
+        results.append((count, timings[0], timings[1], tunneled))
+    return results
+
+def print_bench_movement(results):
+    print(f"{'obstacles':>10} {'grid':>11} {'one cell':>11} {'tunnels':>8}")
+    for count, grid, single, tunneled in results:
+        print(f"{count:>10} {grid * 1e6:>8.2f} us {single * 1e6:>8.2f} us {'yes' if tunneled else 'no':>8}")
+
+def bench_level(counts=(16, 50000), obstacles=100, seed=0):
+    source = Simulation.load_level()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            rng = random.Random(seed)
+            rects = source.obstacle_rects.tolist()
+            while len(rects) < len(source.obstacle_rects) + obstacles:
+                rects.append([rng.randint(0, Simulation.BASE_WIDTH - 40), rng.randint(0, Simulation.BASE_HEIGHT - 40),
+                              rng.randint(10, 40), rng.randint(10, 40)])
+            path = os.path.join(directory, f"bench{count}.json")
+            with open(path, "w") as f:
+                json.dump({"name": f"bench{count}", "map": source.map, "size": list(source.size),
+                           "player_start": list(source.player_start), "trash": count, "power_ups": 3,
+                           "spawn_zones": [[50, 50, 1451, 751]], "obstacles": rects}, f)
+
+            start = time.perf_counter()
+            Simulation.load_level(path)
+            compiled = time.perf_counter() - start
+            start = time.perf_counter()
+            level = Simulation.load_level(path)
+            loaded = time.perf_counter() - start
+            start = time.perf_counter()
+            Simulation(level, seed)
+            spawned = time.perf_counter() - start
+
+            rng = random.Random(seed)
+            tries = 0
+            start = time.perf_counter()
+            for _ in range(count):
+                while True:
+                    tries += 1
+                    rect = pygame.Rect(rng.randint(50, 1500), rng.randint(50, 800), Simulation.PICKUP_SIZE, Simulation.PICKUP_SIZE)
+                    if not level.obstacles.collides(rect):
+                        break
+            rejected = time.perf_counter() - start
+
+            results.append((count, len(level.spawn_cells), compiled, loaded, spawned, rejected, tries / count))
+    return results
+
+def print_bench_level(results):
+    print(f"{'items':>7} {'cells':>7} {'compile':>10} {'cached':>10} {'spawn':>10} {'rejection':>10} {'tries':>6}")
+    for count, cells, compiled, loaded, spawned, rejected, tries in results:
+        print(f"{count:>7} {cells:>7} {compiled * 1000:>7.2f} ms {loaded * 1000:>7.2f} ms "
+              f"{spawned * 1000:>7.2f} ms {rejected * 1000:>7.2f} ms {tries:>6.1f}")
+
+def bench_telemetry(records=2000000, submits=10000, top=10, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.log")
+        writer = TelemetryWriter(path)
+        latencies = np.zeros(submits)
+        for index in range(submits):
+            record = (time.time(), index, int(rng.integers(20000, 120000)), 19, 3, 1, 3600, 4.0, 6.0, 9.0)
+            start = time.perf_counter()
+            writer.submit(record)
+            latencies[index] = time.perf_counter() - start
+            if index % 100 == 99:
+                time.sleep(0.001)
+        writer.close()
+        results["submit_us"] = float(latencies.mean() * 1e6)
+        results["submit_max_us"] = float(latencies.max() * 1e6)
+        results["writer"] = dict(writer.stats)
+
+        data = np.zeros(records, SessionLog.DTYPE)
+        data["seed"] = np.arange(records)
+        data["elapsed_ms"] = rng.integers(20000, 600000, records)
+        data["cleared"] = rng.random(records) < 0.7
+        with open(path, "ab") as f:
+            f.write(data.tobytes())
+        total = SessionLog.record_count(path)
+
+        start = time.perf_counter()
+        rows = list(SessionLog.RECORD.iter_unpack(read_file(path)[SessionLog.HEADER.size:]))
+        expected = sorted(row[2] for row in rows if row[5])[:top]
+        results["scan_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        leaderboard = Leaderboard(path)
+        leaderboard.refresh()
+        found = leaderboard.top(top)["elapsed_ms"].tolist()
+        results["cold_ms"] = (time.perf_counter() - start) * 1000
+
+        with open(path, "ab") as f:
+            f.write(data[:1000].tobytes())
+        start = time.perf_counter()
+        leaderboard = Leaderboard(path)
+        leaderboard.refresh()
+        leaderboard.top(top)
+        results["indexed_ms"] = (time.perf_counter() - start) * 1000
+
+        results["records"] = total
+        results["matches"] = found == expected
+    return results
+
+def print_bench_telemetry(result):
+    writer = result["writer"]
+    print(f"submit:  {result['submit_us']:.2f} us mean, {result['submit_max_us']:.1f} us max "
+          f"({writer['written']} written, {writer['dropped']} dropped, {writer['syncs']} fsyncs)")
+    print(f"top-N over {result['records']:,} records:")
+    print(f"  struct scan     {result['scan_ms']:9.1f} ms")
+    print(f"  numpy cold      {result['cold_ms']:9.1f} ms  (matches scan: {result['matches']})")
+    print(f"  indexed +1000   {result['indexed_ms']:9.1f} ms")
+
+def bench_particles(counts=(1000, 10000, 100000), frames=60):
+    screen = pygame.Surface((Game.BASE_WIDTH, Game.BASE_HEIGHT))
+    colors = [(255, 255, 0), (144, 238, 144), (255, 165, 0)]
+    results = []
+    for count in counts:
+        pool = ParticlePool(capacity=count, lifetime=10 ** 9, seed=0)
+        rng = random.Random(0)
+        while len(pool) < count:
+            pool.spawn(rng.uniform(0, Game.BASE_WIDTH), rng.uniform(0, Game.BASE_HEIGHT),
+                       rng.choice(colors), 0, min(15, count - len(pool)))
+        pool.radius[:count] = 1000
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            pool.update(0)
+        update = (time.perf_counter() - start) / frames
+
+        pool.radius[:count] = 6
+        start = time.perf_counter()
+        for _ in range(frames):
+            pool.draw(screen, (1.0, 1.0))
+        draw = (time.perf_counter() - start) / frames
+
+        results.append((count, update, draw))
+    return results
+
+def print_bench_particles(results):
+    print(f"{'particles':>10} {'update':>11} {'draw':>11}")
+    for count, update, draw in results:
+        print(f"{count:>10} {update * 1000:>8.3f} ms {draw * 1000:>8.3f} ms")
+
+def bench_render(sizes=((1600, 900), (3840, 2160)), frames=300, seed=0):
+    game = Game(headless=True)
+    results = []
+    for size in sizes:
+        game.handle_resize(size)
+        game.screen = pygame.display.set_mode(size, pygame.RESIZABLE)
+        for dirty in (False, True):
+            game.reseed(seed)
+            game.sim_ticks = 0
+            game.particles.clear()
+            game.dirty_rendering = dirty
+            game.reset_game()
+            script = ScriptedInput(seed)
+            game.render_stats.update(frames=0, full_frames=0, blit_bytes=0, render_ms=0.0)
+            for _ in range(frames):
+                game.input_keys = script.next_keys()
+                game.step()
+                game.render()
+            stats = game.render_stats
+            results.append((size, dirty, stats["blit_bytes"] / frames, stats["render_ms"] / frames,
+                            stats["full_frames"]))
+    game.input_keys = None
+    return results
+
+def print_bench_render(results):
+    print(f"{'size':>10} {'mode':>6} {'bytes/frame':>14} {'ms/frame':>9} {'full':>5}")
+    for (width, height), dirty, blit_bytes, render_ms, full_frames in results:
+        mode = "dirty" if dirty else "full"
+        print(f"{width:>5}x{height:<4} {mode:>6} {blit_bytes:>14,.0f} {render_ms:>9.3f} {full_frames:>5}")
+
+def bench_blit(blits=500):
+    game = Game(headless=True)
+    pickup_size = game.pickup_img_size()
+    player_size = (game.PLAYER_SIZE, game.PLAYER_SIZE)
+    cases = [
+        ("menu", "menu.png", (game.WIDTH, game.HEIGHT), game.original_menu_img),
+        ("map", "map.png", (game.WIDTH, game.HEIGHT), game.original_map_img),
+        ("score_board", "score_board.png", game.score_board_img.get_size(), game.original_score_board_img),
+        ("walk1", os.path.join("student", "walk1.png"), player_size, game.original_student_walk_frames[0]),
+        ("shawarma", os.path.join("powerups", "shawarma.png"), pickup_size, game.original_shawarma_img),
+        ("lemon", os.path.join("powerups", "lemon.png"), pickup_size, game.original_lemon_img),
+        ("trash1", os.path.join("trash", "trash1.png"), pickup_size, game.original_trash_imgs[0]),
+    ]
+
+    def time_blits(surface):
+        start = time.perf_counter()
+        for _ in range(blits):
+            game.screen.blit(surface, (0, 0))
+        return (time.perf_counter() - start) / blits
+
+    results = []
+    for name, path, size, original in cases:
+        raw = pygame.transform.scale(pygame.image.load(os.path.join(game.ASSETS_PATH, path)), size)
+        prepared = pygame.transform.scale(original, size)
+        if original.get_flags() & pygame.SRCALPHA:
+            game.prepare_sprite(prepared)
+        results.append((name, size, time_blits(raw), time_blits(prepared)))
+    return results
+
+def print_bench_blit(results):
+    print(f"{'asset':>12} {'size':>10} {'raw':>11} {'prepared':>11} {'speedup':>8}")
+    for name, (width, height), raw, prepared in results:
+        print(f"{name:>12} {width:>5}x{height:<4} {raw * 1e6:>8.1f} us {prepared * 1e6:>8.1f} us {raw / prepared:>7.1f}x")
+
+def bench_sprites(counts=(16, 1000, 10000), frames=60, seed=0):
+    game = Game(headless=True)
+    pickup_size = game.pickup_img_size()
+    images = {kind: game.sprites[name] for kind, name in game.KIND_SPRITES.items()}
+    results = []
+    for count in counts:
+        rng = random.Random(seed)
+        items = []
+        for _ in range(count):
+            kind = rng.choice(list(images))
+            rect = pygame.Rect(rng.randint(50, game.WIDTH - 100), rng.randint(50, game.HEIGHT - 100), *pickup_size)
+            items.append(Entity(kind, rect))
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            for item in items:
+                game.screen.blit(images[item.kind], (item.rect.x, item.rect.y))
+        loop = (time.perf_counter() - start) / frames
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            game.screen.blits(game.sprite_blits(items, (), False), False)
+        batched = (time.perf_counter() - start) / frames
+
+        results.append((count, loop, batched))
+    return results
+
+def print_bench_sprites(results):
+    print(f"{'sprites':>8} {'blit loop':>11} {'batched':>12} {'speedup':>8}")
+    for count, loop, batched in results:
+        print(f"{count:>8} {loop * 1000:>8.3f} ms {batched * 1000:>9.3f} ms {loop / batched:>7.2f}x")
+
+def world_state(game):
+    sim = game.sim
+    return (
+        tuple(sim.player.rect),
+        sim.player_speed,
+        sorted(tuple(trash.rect) + (trash.kind,) for trash in sim.trash_items),
+        sorted(tuple(power_up.rect) + (power_up.kind,) for power_up in sim.power_ups),
+        sorted(tuple(obstacle.rect) for obstacle in sim.obstacles),
+        game.particles.x[:len(game.particles)].tobytes() + game.particles.y[:len(game.particles)].tobytes(),
+    )
+
+def stress_resize(resizes=1000, ticks=300, seed=0):
+    game = Game(headless=True)
+    game.reseed(seed)
+    game.reset_game()
+    script = ScriptedInput(seed)
+    for _ in range(ticks):
+        game.input_keys = script.next_keys()
+        game.step()
+    game.input_keys = None
+    game.render()
+    before_state = world_state(game)
+    before_frame = pygame.image.tostring(game.screen, "RGB")
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(resizes):
+        game.handle_resize((rng.randint(320, 3840), rng.randint(180, 2160)))
+    elapsed = time.perf_counter() - start
+
+    game.handle_resize((game.BASE_WIDTH, game.BASE_HEIGHT))
+    game.render()
+    return {
+        "resizes": resizes,
+        "resize_us": elapsed / resizes * 1e6,
+        "state_unchanged": world_state(game) == before_state,
+        "frame_unchanged": pygame.image.tostring(game.screen, "RGB") == before_frame,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CLEAN Ers")
+    parser.add_argument("--bench", action="store_true", help="run the headless simulation benchmark")
+    parser.add_argument("--bench-collisions", action="store_true", help="compare grid and linear-scan collision queries")
+    parser.add_argument("--bench-movement", action="store_true", help="time swept player movement against growing obstacle counts")
+    parser.add_argument("--bench-sprites", action="store_true", help="compare per-sprite blits with one batched blits call")
+    parser.add_argument("--bench-blit", action="store_true", help="compare blits of raw and display-converted assets")
+    parser.add_argument("--bench-render", action="store_true", help="compare dirty-rect and full-frame rendering")
+    parser.add_argument("--bench-level", action="store_true", help="time level compile, cached load and spawning against rejection sampling")
+    parser.add_argument("--bench-particles", action="store_true", help="time particle pool update and draw")
+    parser.add_argument("--stress-resize", type=int, metavar="N", help="resize N times mid-game and check world state is untouched")
+    parser.add_argument("--pack-assets", action="store_true", help="pack images, sounds and the font into assets/assets.bundle")
+    parser.add_argument("--bake-intro", nargs="+", metavar="WxH", help="pre-bake the intro video at these resolutions")
+    parser.add_argument("--fps", type=int, help=f"frame rate cap; 0 runs uncapped (default {Game.TARGET_FPS})")
+    parser.add_argument("--vsync", action="store_true", help="request a vsynced, SDL-scaled window; the frame cap is dropped only if vsync is confirmed")
+    parser.add_argument("--telemetry", metavar="PATH", default=Game.TELEMETRY_FILE, help=f"append session results to this log (default {Game.TELEMETRY_FILE})")
+    parser.add_argument("--no-telemetry", action="store_true", help="do not write session results")
+    parser.add_argument("--leaderboard", type=int, metavar="N", help="print the N fastest cleared sessions from the telemetry log")
+    parser.add_argument("--bench-telemetry", action="store_true", help="time telemetry submits and top-N reads over millions of records")
+    parser.add_argument("--stats", action="store_true", help="print collected runtime stats on exit")
+    parser.add_argument("--audio-frequency", type=int, help=f"mixer sample rate in Hz (default {Game.AUDIO_FREQUENCY})")
+    parser.add_argument("--audio-buffer", type=int, help=f"mixer buffer size in samples; lower means less latency (default {Game.AUDIO_BUFFER})")
+    parser.add_argument("--profile", action="store_true", help="time frame sections; F3 toggles the overlay")
+    parser.add_argument("--trace", metavar="PATH", help="write a Chrome trace-event JSON of the session (implies --profile)")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--ticks", type=int, default=3600, help="max ticks per session")
+    parser.add_argument("--multi-session", type=int, metavar="N", help="simulate N independent sessions without a window, sharded across processes")
+    parser.add_argument("--workers", type=int, help="worker processes for --multi-session (default: CPU count)")
+    parser.add_argument("--level", metavar="PATH", help=f"level file to play (default {Simulation.DEFAULT_LEVEL})")
+    parser.add_argument("--seed", type=int, help="seed for level generation (benchmarks default to 0)")
+    parser.add_argument("--record", metavar="PATH", help="record per-tick input of the session to a binary log")
+    parser.add_argument("--replay", metavar="PATH", help="replay a recorded input log headless and report per-tick state hashes")
+    parser.add_argument("--hashes", metavar="PATH", help="with --replay, write one state hash per tick to PATH")
+    parser.add_argument("--expect-hashes", metavar="PATH", help="with --replay, exit non-zero if the state diverges from these hashes")
+    parser.add_argument("--min-tps", type=float, default=0.0, help="exit non-zero below this ticks/sec")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    seed = args.seed if args.seed is not None else 0
+    if args.bench:
+        result = benchmark(args.sessions, args.ticks, seed, args.level)
+        print_benchmark(result)
+        pygame.quit()
+        if result["ticks_per_sec"] < args.min_tps:
+            sys.exit(1)
+        return
+    if args.multi_session:
+        print_sessions(run_sessions(args.multi_session, args.ticks, args.workers, seed, args.level))
+        return
+    if args.pack_assets:
+        pygame.init()
+        pygame.mixer.init()
+        path = os.path.join("assets", Game.BUNDLE_FILE)
+        entries = AssetBundle.pack("assets", path)
+        print(f"packed {len(entries)} assets -> {path} ({os.path.getsize(path):,} bytes)")
         pygame.quit()
+        return
+    if args.bake_intro:
+        sizes = [tuple(int(part) for part in size.lower().split("x")) for size in args.bake_intro]
+        try:
+            bake_intro(os.path.join("assets", "intro.mp4"), sizes, os.path.join("assets", "intro_cache"))
+        except ValueError as error:
+            sys.exit(f"bake failed: {error}")
+        return
+    if args.bench_collisions:
+        print_bench_collisions(bench_collisions())
+        return
+    if args.bench_movement:
+        print_bench_movement(bench_movement())
+        return
+    if args.bench_sprites:
+        print_bench_sprites(bench_sprites())
+        return
+    if args.bench_blit:
+        print_bench_blit(bench_blit())
+        return
+    if args.bench_render:
+        print_bench_render(bench_render())
+        return
+    if args.leaderboard:
+        leaderboard = Leaderboard(args.telemetry)
+        added = leaderboard.refresh()
+        print(f"{leaderboard.scanned} sessions ({added} new since last index)")
+        for rank, record in enumerate(leaderboard.top(args.leaderboard).tolist(), 1):
+            print(f"{rank:>3}. {record[2] / 1000:8.2f}s  seed {record[1]}  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(record[0]))}")
+        return
+    if args.bench_telemetry:
+        print_bench_telemetry(bench_telemetry())
+        return
+    if args.bench_level:
+        print_bench_level(bench_level())
+        return
+    if args.bench_particles:
+        print_bench_particles(bench_particles())
+        return
+    if args.stress_resize:
+        result = stress_resize(args.stress_resize, seed=seed)
+        print(f"{result['resizes']} resizes, {result['resize_us']:.1f} us/resize, "
+              f"state unchanged: {result['state_unchanged']}, frame unchanged: {result['frame_unchanged']}")
+        pygame.quit()
+        if not (result["state_unchanged"] and result["frame_unchanged"]):
+            sys.exit(1)
+        return
+
+    if args.replay:
+        expected = None
+        if args.expect_hashes:
+            with open(args.expect_hashes) as f:
+                expected = f.read().split()
+        try:
+            result = replay(args.replay, expected)
+        except ValueError as error:
+            pygame.quit()
+            sys.exit(f"replay failed: {error}")
+        print_replay(result)
+        if args.hashes:
+            with open(args.hashes, "w") as f:
+                f.writelines(state + "\n" for state in result["hashes"])
+        pygame.quit()
+        if result["diverged"] is not None:
+            sys.exit(1)
+        return
+
+    game = Game(seed=args.seed, audio_frequency=args.audio_frequency, audio_buffer=args.audio_buffer, level=args.level,
+                fps=args.fps, vsync=args.vsync, telemetry=None if args.no_telemetry else args.telemetry)
+    if args.record:
+        game.start_recording(args.record)
+    if args.profile or args.trace:
+        game.enable_profiler(trace=bool(args.trace))
+    game.run()
+    game.stop_recording()
+    if game.profiler:
+        game.stats["profile"] = game.profiler.percentiles()
+    if args.trace:
+        events = game.profiler.dump_trace(args.trace)
+        print(f"wrote {events} trace events -> {args.trace}")
+    if args.stats:
+        print(json.dumps(game.stats, indent=2))
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
\ No newline at end of file
+    main()
\ No newline at end of file